@@ -0,0 +1,128 @@
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import os
+import uuid
+from fastapi import HTTPException
+
+load_dotenv()
+
+USER = os.getenv("DB_USER")
+PASSWORD = os.getenv("DB_PASSWORD")
+HOST = os.getenv("DB_HOST")
+PORT = os.getenv("DB_PORT")
+DBNAME = os.getenv("DB_NAME")
+SSLMODE = os.getenv("DB_SSLMODE", "require")
+
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_STREAM_ITERSIZE = int(os.getenv("DB_STREAM_ITERSIZE", "2000"))
+
+# make_conninfo quotes values and skips the ones left unset
+CONNINFO = make_conninfo(
+    host=HOST,
+    port=PORT or None,
+    dbname=DBNAME,
+    user=USER,
+    password=PASSWORD or None,
+    sslmode=SSLMODE,
+)
+
+def _make_pool(name, min_size, max_size):
+    # psycopg_pool queues waiting clients in FIFO order and gives up after `timeout`
+    return AsyncConnectionPool(
+        conninfo=CONNINFO,
+        name=name,
+        min_size=min_size,
+        max_size=max_size,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        timeout=DB_POOL_TIMEOUT,
+        check=AsyncConnectionPool.check_connection,
+        kwargs={"row_factory": dict_row},
+        open=False,
+    )
+
+# Opened on app startup, async handlers await queries instead of blocking the event loop.
+# Long analytic scans get their own smaller pool so they cannot starve short OLTP queries.
+async_pool = _make_pool("oltp", 1, int(os.getenv("DB_ASYNC_POOL_MAX", "10")))
+analytics_pool = _make_pool("analytics", 0, int(os.getenv("DB_ANALYTICS_POOL_MAX", "3")))
+# Streamed responses hold a connection for as long as the client reads
+stream_pool = _make_pool("stream", 0, int(os.getenv("DB_STREAM_POOL_MAX", "3")))
+
+async def open_async_pool():
+    await async_pool.open()
+    await analytics_pool.open()
+    await stream_pool.open()
+
+async def close_async_pool():
+    await async_pool.close()
+    await analytics_pool.close()
+    await stream_pool.close()
+
+def async_pool_metrics():
+    return {pool.name: pool.get_stats() for pool in (async_pool, analytics_pool, stream_pool)}
+
+async def execute_query_async(query, params=None, fetch=True, pool=None):
+    """
+    Async counterpart of database.db.execute_query: same %s parameters,
+    same list-of-dicts result and same HTTPException on failure.
+    """
+    pool = pool or async_pool
+    try:
+        async with pool.connection() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(query, params or ())
+                    result = None
+                    if fetch:
+                        result = await cursor.fetchall()
+                await conn.commit()
+                return result
+
+            except Exception as e:
+                await conn.rollback()
+                raise HTTPException(status_code=500, detail=str(e))
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail=f"Database busy: no {pool.name} connection free within {DB_POOL_TIMEOUT}s")
+
+async def execute_analytics_query_async(query, params=None, fetch=True):
+    return await execute_query_async(query, params, fetch, pool=analytics_pool)
+
+
+@asynccontextmanager
+async def async_transaction(pool=None):
+    """
+    Borrow a connection and run the with block as one transaction: committed
+    when the block exits, rolled back if it raises. HTTPExceptions raised by the
+    block pass through, database errors become a 500 like in execute_query_async.
+    """
+    pool = pool or async_pool
+    try:
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                yield conn
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail=f"Database busy: no {pool.name} connection free within {DB_POOL_TIMEOUT}s")
+    except psycopg.Error as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def stream_query_async(query, params=None, pool=None, itersize=DB_STREAM_ITERSIZE):
+    """
+    Async generator over the rows of a query, read from a server-side cursor
+    itersize rows at a time. The connection comes from stream_pool unless another
+    pool is given and is held until the generator finishes.
+    """
+    pool = pool or stream_pool
+    try:
+        async with pool.connection() as conn:
+            async with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = itersize
+                await cursor.execute(query, params or ())
+                async for row in cursor:
+                    yield row
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail=f"Database busy: no {pool.name} connection free within {DB_POOL_TIMEOUT}s")
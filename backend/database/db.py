@@ -1,8 +1,13 @@
-from psycopg2 import pool
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import os
+import threading
+import time
+import uuid
+from collections import deque
 from fastapi import HTTPException
 
 load_dotenv()
@@ -12,8 +17,24 @@ PASSWORD = os.getenv("DB_PASSWORD")
 HOST = os.getenv("DB_HOST")
 PORT = os.getenv("DB_PORT")
 DBNAME = os.getenv("DB_NAME")
+SSLMODE = os.getenv("DB_SSLMODE", "require")
 
-def get_conn():
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Connections older than this are closed instead of being handed out again
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+# Idle connections are pinged with SELECT 1 before reuse after this many seconds
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))
+# How long a checkout may queue for a free connection before failing with 503
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Rows fetched per round trip by server-side cursors of streamed queries
+DB_STREAM_ITERSIZE = int(os.getenv("DB_STREAM_ITERSIZE", "2000"))
+# Streamed responses hold their connection as long as the client reads, so they
+# get their own small pool instead of competing with the OLTP pool
+DB_STREAM_POOL_MAX = int(os.getenv("DB_STREAM_POOL_MAX", "3"))
+
+
+def _connect():
     return psycopg2.connect(
         host=HOST,
         port=PORT,
@@ -21,17 +42,197 @@ def get_conn():
         user=USER,
         password=PASSWORD,
         cursor_factory=RealDictCursor,
-        sslmode="require"
+        sslmode=SSLMODE
     )
 
-db_pool = pool.SimpleConnectionPool(
-    1, 10,  # min and max connections
-    host=HOST,
-    database=DBNAME,
-    user=USER,
-    password=PASSWORD,
-    cursor_factory=RealDictCursor
-)
+
+class PoolTimeout(HTTPException):
+    def __init__(self, name, timeout):
+        super().__init__(status_code=503, detail=f"Database busy: no {name} connection free within {timeout}s")
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+    Once max_size are in use, checkouts queue in FIFO order for up to `timeout`
+    seconds. Connections are recycled after max_lifetime and pinged before reuse
+    when they sat idle.
+    """
+
+    def __init__(self, name, min_size, max_size, max_lifetime, health_check_after, timeout, connect=_connect):
+        self.name = name
+        self.timeout = timeout
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.connect = connect
+
+        self.cond = threading.Condition()
+        self.idle = []          # (conn, created_at, returned_at)
+        self.queue = deque()    # waiting checkouts, served first come first served
+        self.created = {}       # id(conn) -> created_at for every open connection
+        self.in_use = 0
+        self.stats = {"checkouts": 0, "waits": 0, "wait_time_total": 0.0, "wait_time_max": 0.0,
+                      "timeouts": 0, "recycled": 0, "failed_health_checks": 0}
+
+        for _ in range(min_size):
+            conn = self.connect()
+            self.created[id(conn)] = time.monotonic()
+            self.idle.append((conn, self.created[id(conn)], time.monotonic()))
+
+    def _close(self, conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _take_idle(self, dead):
+        """
+        Under the lock: pop the next idle connection that is neither closed nor past
+        max_lifetime, or None. Rejected ones are forgotten and appended to `dead`
+        so they can be closed once the lock is released.
+        """
+        while self.idle:
+            conn, created_at, returned_at = self.idle.pop()
+            if conn.closed or time.monotonic() - created_at > self.max_lifetime:
+                if not conn.closed:
+                    self.stats["recycled"] += 1
+                self.created.pop(id(conn), None)
+                dead.append(conn)
+                continue
+            return conn, returned_at
+        return None
+
+    def _reserve(self, started):
+        # Hold a slot for a new connection, made outside of the lock
+        placeholder = object()
+        self.created[id(placeholder)] = started
+        return placeholder
+
+    def _ping(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _available(self):
+        return bool(self.idle) or len(self.created) < self.max_size
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        dead = []
+        placeholder = None
+        with self.cond:
+            if self.queue or not self._available():
+                # Queue behind earlier waiters so nobody can barge ahead of them
+                ticket = object()
+                self.queue.append(ticket)
+                waited = True
+                try:
+                    while self.queue[0] is not ticket or not self._available():
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.stats["timeouts"] += 1
+                            raise PoolTimeout(self.name, timeout)
+                        self.cond.wait(remaining)
+                finally:
+                    self.queue.remove(ticket)
+                    self.cond.notify_all()
+
+            candidate = self._take_idle(dead)
+            if candidate is None:
+                placeholder = self._reserve(started)
+
+        # The candidate still counts as open, so its slot stays taken while it is
+        # pinged without holding the lock
+        while candidate is not None:
+            self._close(dead)
+            dead = []
+            conn, returned_at = candidate
+            if time.monotonic() - returned_at <= self.health_check_after or self._ping(conn):
+                with self.cond:
+                    return self._checkout(conn, started, waited)
+
+            dead.append(conn)
+            with self.cond:
+                self.stats["failed_health_checks"] += 1
+                self.created.pop(id(conn), None)
+                self.cond.notify_all()
+                candidate = self._take_idle(dead)
+                if candidate is None:
+                    placeholder = self._reserve(started)
+        self._close(dead)
+
+        try:
+            conn = self.connect()
+        except Exception:
+            with self.cond:
+                self.created.pop(id(placeholder), None)
+                self.cond.notify_all()
+            raise
+
+        with self.cond:
+            self.created.pop(id(placeholder), None)
+            self.created[id(conn)] = time.monotonic()
+            return self._checkout(conn, started, waited)
+
+    def _checkout(self, conn, started, waited):
+        self.in_use += 1
+        self.stats["checkouts"] += 1
+        if waited:
+            wait_time = time.monotonic() - started
+            self.stats["waits"] += 1
+            self.stats["wait_time_total"] += wait_time
+            self.stats["wait_time_max"] = max(self.stats["wait_time_max"], wait_time)
+        return conn
+
+    def putconn(self, conn, close=False):
+        # Roll back outside of the lock, a stuck connection must not block the pool
+        if not close and not conn.closed:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    close = True
+
+        with self.cond:
+            self.in_use -= 1
+            created_at = self.created.get(id(conn))
+            discard = close or conn.closed or created_at is None
+            if discard:
+                self.created.pop(id(conn), None)
+            else:
+                self.idle.append((conn, created_at, time.monotonic()))
+            self.cond.notify_all()
+
+        if discard:
+            self._close([conn])
+
+    def metrics(self):
+        with self.cond:
+            return {
+                "name": self.name,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "open": len(self.created),
+                "idle": len(self.idle),
+                "in_use": self.in_use,
+                "waiting": len(self.queue),
+                "utilization": self.in_use / self.max_size,
+                **self.stats,
+            }
+
+
+db_pool = ConnectionPool("oltp", DB_POOL_MIN, DB_POOL_MAX, DB_POOL_MAX_LIFETIME, DB_POOL_HEALTH_CHECK_AFTER, DB_POOL_TIMEOUT)
+stream_pool = ConnectionPool("stream", 0, DB_STREAM_POOL_MAX, DB_POOL_MAX_LIFETIME, DB_POOL_HEALTH_CHECK_AFTER, DB_POOL_TIMEOUT)
 
 def get_connection():
     return db_pool.getconn()
@@ -39,6 +240,21 @@ def get_connection():
 def release_connection(conn):
     db_pool.putconn(conn)
 
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a pooled connection for the duration of a with block.
+    Uncommitted work is rolled back when the block raises.
+    """
+    conn = get_connection()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_connection(conn)
+
 def execute_query(query, params=None, fetch=True):
     conn = get_connection()
     try:
@@ -56,3 +272,40 @@ def execute_query(query, params=None, fetch=True):
     finally:
         cursor.close()
         release_connection(conn)
+
+def stream_query(query, params=None, itersize=DB_STREAM_ITERSIZE):
+    """
+    Yield the rows of a query from a server-side cursor, itersize rows per round
+    trip, so memory stays flat however many rows match. The connection comes from
+    stream_pool and is held until the generator is exhausted or closed.
+    """
+    conn = stream_pool.getconn()
+    try:
+        cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        try:
+            cursor.itersize = itersize
+            cursor.execute(query, params or ())
+            yield from cursor
+        finally:
+            cursor.close()
+        conn.commit()
+    finally:
+        stream_pool.putconn(conn)
+
+def fetch_columns(query, params=None):
+    """
+    Run a query and return {column: tuple of values}, read through a plain tuple
+    cursor and transposed, so no per-row dict is ever built.
+    """
+    with pooled_connection() as conn:
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+                cursor.execute(query, params or ())
+                names = [d.name for d in cursor.description]
+                rows = cursor.fetchall()
+            conn.commit()
+        except psycopg2.Error as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    if not rows:
+        return {}
+    return dict(zip(names, zip(*rows)))
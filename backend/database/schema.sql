@@ -66,4 +66,107 @@ CREATE TABLE IF NOT EXISTS portfolio_owned (
     FOREIGN KEY(username)
         REFERENCES users(username)
         ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+-- ==============================
+--  STOCK_RETURNS TABLE
+-- ==============================
+-- Per-symbol daily simple and log returns, maintained by the stocks ingest path
+
+CREATE INDEX IF NOT EXISTS stocks_timestamp_idx ON stocks (timestamp);
+
+CREATE TABLE IF NOT EXISTS stock_returns (
+    symbol VARCHAR(10) NOT NULL,
+    timestamp DATE NOT NULL,
+    r DOUBLE PRECISION NOT NULL,
+    log_r DOUBLE PRECISION,
+
+    PRIMARY KEY (symbol, timestamp)
+);
+
+CREATE INDEX IF NOT EXISTS stock_returns_timestamp_idx ON stock_returns (timestamp);
+
+INSERT INTO stock_returns (symbol, timestamp, r, log_r)
+SELECT symbol, timestamp, close / prev_close - 1,
+    CASE WHEN close > 0 AND prev_close > 0 THEN LN(close / prev_close) END
+FROM (
+    SELECT
+        symbol,
+        timestamp,
+        close,
+        NULLIF(LAG(close) OVER (PARTITION BY symbol ORDER BY timestamp), 0) AS prev_close
+    FROM stocks
+) t
+WHERE prev_close IS NOT NULL
+ON CONFLICT (symbol, timestamp) DO NOTHING;
+
+
+-- ==============================
+--  MARKET_RETURNS TABLE
+-- ==============================
+-- Equal-weighted daily market return, maintained by the stocks ingest path
+
+CREATE TABLE IF NOT EXISTS market_returns (
+    timestamp DATE PRIMARY KEY,
+    market_r DOUBLE PRECISION NOT NULL,
+    n_symbols INT NOT NULL
+);
+
+INSERT INTO market_returns (timestamp, market_r, n_symbols)
+SELECT timestamp, AVG(r), COUNT(*)
+FROM stock_returns
+GROUP BY timestamp
+ON CONFLICT (timestamp) DO NOTHING;
+
+
+-- ==============================
+--  SYMBOL_VERSIONS TABLE
+-- ==============================
+-- Data version per symbol, bumped by every write into stocks.
+-- The '_market' row is bumped on any write and versions market_returns.
+
+CREATE TABLE IF NOT EXISTS symbol_versions (
+    symbol VARCHAR(10) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+
+-- ==============================
+--  LATEST_PRICES TABLE
+-- ==============================
+-- Newest close of every symbol, maintained by the stocks ingest path so valuation
+-- and trading read one row per symbol instead of sorting its price history
+
+CREATE TABLE IF NOT EXISTS latest_prices (
+    symbol VARCHAR(10) PRIMARY KEY,
+    timestamp DATE NOT NULL,
+    close REAL NOT NULL
+);
+
+INSERT INTO latest_prices (symbol, timestamp, close)
+SELECT DISTINCT ON (symbol) symbol, timestamp, close
+FROM stocks
+ORDER BY symbol, timestamp DESC
+ON CONFLICT (symbol) DO NOTHING;
+
+
+-- ==============================
+--  PORTFOLIO_SNAPSHOTS TABLE
+-- ==============================
+-- End-of-day cash, holdings value and share counts per portfolio, appended lazily by the
+-- equity curve endpoint for completed trading days. Rows from a day whose prices
+-- are later revised are dropped by the stocks ingest path and rebuilt on demand.
+
+CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+    portfolio_id INT NOT NULL,
+    timestamp DATE NOT NULL,
+    cash DOUBLE PRECISION NOT NULL,
+    market_value DOUBLE PRECISION NOT NULL,
+    holdings JSONB NOT NULL DEFAULT '{}',
+
+    PRIMARY KEY (portfolio_id, timestamp),
+
+    FOREIGN KEY (portfolio_id)
+        REFERENCES portfolio (portfolio_id)
+        ON DELETE CASCADE
+);
@@ -3,6 +3,11 @@ from fastapi import FastAPI
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from redis_client import redis_client
+from database.db import db_pool, stream_pool, execute_query
+from services import refresh, forecast
+from services.l1cache import listen_invalidations
+from database.async_db import open_async_pool, close_async_pool, async_pool_metrics
+import asyncio
 
 app = FastAPI()
 
@@ -24,6 +29,49 @@ app.include_router(users.router)
 app.include_router(reviews.router)
 app.include_router(portfolio.router)
 
+@app.on_event("startup")
+async def startup_async_pool():
+    await open_async_pool()
+
+@app.on_event("shutdown")
+async def shutdown_async_pool():
+    await close_async_pool()
+
+@app.on_event("shutdown")
+async def shutdown_forecast_workers():
+    await asyncio.to_thread(forecast.shutdown_executor)
+
+@app.on_event("startup")
+async def start_l1_invalidation_listener():
+    app.state.l1_listener = asyncio.create_task(listen_invalidations())
+
+@app.on_event("shutdown")
+async def stop_l1_invalidation_listener():
+    app.state.l1_listener.cancel()
+    try:
+        await app.state.l1_listener
+    except asyncio.CancelledError:
+        pass
+
+@app.on_event("startup")
+async def schedule_nightly_refresh():
+    # Keep a reference, the event loop only holds tasks weakly
+    app.state.nightly_refresh = None
+    if refresh.REFRESH_DAILY_AT:
+        app.state.nightly_refresh = asyncio.create_task(
+            refresh.nightly_refresh_loop(on_done=portfolio.recompute_hot_portfolios)
+        )
+
+@app.on_event("shutdown")
+async def stop_nightly_refresh():
+    task = app.state.nightly_refresh
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
 @app.get("/test")
 def read_test():
     return {"message": "Welcome to FastAPI"}
@@ -33,3 +81,12 @@ async def test_redis():
     await redis_client.set("hello", "world")
     value = await redis_client.get("hello")
     return {"value": value}
+
+@app.get("/health/db")
+def db_health():
+    execute_query("SELECT 1", fetch=False)
+    return {"status": "ok", "pool": db_pool.metrics()}
+
+@app.get("/health/db/pools")
+def db_pool_metrics():
+    return {"sync": db_pool.metrics(), "sync_stream": stream_pool.metrics(), "async": async_pool_metrics()}
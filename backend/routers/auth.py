@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel
-from database.db import get_conn
+from database.db import pooled_connection
 
 router = APIRouter(
     prefix="/users",
@@ -16,55 +16,50 @@ class UserOut(BaseModel):
 
 @router.post("/signup", response_model=UserOut)
 def sign_up(user: User, request: Request):
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
+    with pooled_connection() as conn:
+        try:
+            cur = conn.cursor()
 
-        cur.execute("SELECT username FROM users WHERE username=%s;", (user.username,))
-        existing_user = cur.fetchone()
+            cur.execute("SELECT username FROM users WHERE username=%s;", (user.username,))
+            existing_user = cur.fetchone()
 
-        if existing_user:
-            raise HTTPException(status_code=400, detail=f"User {user.username} already exists")
+            if existing_user:
+                raise HTTPException(status_code=400, detail=f"User {user.username} already exists")
 
-        cur.execute("INSERT into users (username, password) VALUES (%s, %s) RETURNING username;", (user.username, user.password))
-        created_username = cur.fetchone()["username"]
-        conn.commit()
-        cur.close()
+            cur.execute("INSERT into users (username, password) VALUES (%s, %s) RETURNING username;", (user.username, user.password))
+            created_username = cur.fetchone()["username"]
+            conn.commit()
+            cur.close()
 
-        if not created_username:
-            raise HTTPException(status_code=404, detail="User could not be created")
+            if not created_username:
+                raise HTTPException(status_code=404, detail="User could not be created")
 
-        request.session["user"] = {"username": created_username}
-        return {"username": created_username}
+            request.session["user"] = {"username": created_username}
+            return {"username": created_username}
 
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        conn.close()
+        except Exception as e:
+            conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/login")
 def login(user: User, request: Request):
-    conn = get_conn()
-    print("Login attempt for user:", user.username)
-    try:
-        cur = conn.cursor()
+    with pooled_connection() as conn:
+        print("Login attempt for user:", user.username)
+        try:
+            cur = conn.cursor()
 
-        cur.execute("SELECT username FROM users WHERE username=%s AND password=%s;", (user.username, user.password))
-        db_user = cur.fetchone()
+            cur.execute("SELECT username FROM users WHERE username=%s AND password=%s;", (user.username, user.password))
+            db_user = cur.fetchone()
 
-        if not db_user:
-            raise HTTPException(status_code=400, detail="Invalid username or password")
-        cur.close()
+            if not db_user:
+                raise HTTPException(status_code=400, detail="Invalid username or password")
+            cur.close()
         
-        request.session["user"] = {"username": db_user["username"]}
-        return {"message": "Login successful", "user": {"username": db_user["username"]}}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+            request.session["user"] = {"username": db_user["username"]}
+            return {"message": "Login successful", "user": {"username": db_user["username"]}}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 
 def get_current_user(request: Request):
@@ -82,155 +77,137 @@ def read_users_me(current_user: str = Depends(get_current_user)):
 @router.get("/friends")
 def get_friends_list(current_user: str = Depends(get_current_user), page: int = 1, limit: int = 10):
     print("Here")
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        offset = (page - 1) * limit
+    with pooled_connection() as conn:
+        try:
+            cur = conn.cursor()
+            offset = (page - 1) * limit
 
-        cur.execute("SELECT COUNT(*) FROM friends WHERE username = %s AND status = 'accepted';", (current_user,))
-        total_count_result = cur.fetchone()
-        total_count = total_count_result['count'] if total_count_result else 0
+            cur.execute("SELECT COUNT(*) FROM friends WHERE username = %s AND status = 'accepted';", (current_user,))
+            total_count_result = cur.fetchone()
+            total_count = total_count_result['count'] if total_count_result else 0
 
 
-        cur.execute("SELECT friendname FROM friends WHERE username = %s AND status = 'accepted' ORDER BY friendname LIMIT %s OFFSET %s;", (current_user, limit, offset))
+            cur.execute("SELECT friendname FROM friends WHERE username = %s AND status = 'accepted' ORDER BY friendname LIMIT %s OFFSET %s;", (current_user, limit, offset))
 
-        results = cur.fetchall()
-        cur.close()
+            results = cur.fetchall()
+            cur.close()
 
-        return {"users": [x["friendname"] for x in results], "total": total_count}
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            return {"users": [x["friendname"] for x in results], "total": total_count}
     
-    finally:
-        conn.close()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/friends/all")
 def get_friends_list(current_user: str = Depends(get_current_user)):
     print("Here")
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
+    with pooled_connection() as conn:
+        try:
+            cur = conn.cursor()
 
-        cur.execute("SELECT friendname FROM friends WHERE username = %s AND status = 'accepted' ORDER BY friendname;", (current_user,))
+            cur.execute("SELECT friendname FROM friends WHERE username = %s AND status = 'accepted' ORDER BY friendname;", (current_user,))
 
-        results = cur.fetchall()
-        cur.close()
+            results = cur.fetchall()
+            cur.close()
 
-        return {"users": [x["friendname"] for x in results]}
+            return {"users": [x["friendname"] for x in results]}
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        conn.close()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/friends/pending", tags=["friends"])
 def get_pending_requests(current_user: str = Depends(get_current_user), page: int = 1, limit: int = 10):
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        offset = (page - 1) * limit
+    with pooled_connection() as conn:
+        try:
+            cur = conn.cursor()
+            offset = (page - 1) * limit
 
-        cur.execute("SELECT COUNT(*) FROM friends WHERE username = %s AND status = 'pending';", (current_user,))
-        total_count = cur.fetchone()['count']
+            cur.execute("SELECT COUNT(*) FROM friends WHERE username = %s AND status = 'pending';", (current_user,))
+            total_count = cur.fetchone()['count']
 
-        cur.execute("SELECT friendname FROM friends WHERE username = %s AND status = 'pending' ORDER BY friendname LIMIT %s OFFSET %s;", (current_user, limit, offset))
+            cur.execute("SELECT friendname FROM friends WHERE username = %s AND status = 'pending' ORDER BY friendname LIMIT %s OFFSET %s;", (current_user, limit, offset))
         
-        results = cur.fetchall()
-        cur.close()
+            results = cur.fetchall()
+            cur.close()
 
-        return {"users": [x["friendname"] for x in results], "total": total_count}
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            return {"users": [x["friendname"] for x in results], "total": total_count}
     
-    finally:
-        conn.close()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/friends/sent", tags=["friends"])
 def get_sent_requests(current_user: str = Depends(get_current_user), page: int = 1, limit: int = 10):
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        offset = (page - 1) * limit
+    with pooled_connection() as conn:
+        try:
+            cur = conn.cursor()
+            offset = (page - 1) * limit
 
-        cur.execute("SELECT COUNT(*) FROM friends WHERE username = %s AND status = 'sent';", (current_user,))
-        total_count = cur.fetchone()['count']
+            cur.execute("SELECT COUNT(*) FROM friends WHERE username = %s AND status = 'sent';", (current_user,))
+            total_count = cur.fetchone()['count']
 
-        cur.execute("SELECT friendname FROM friends WHERE username = %s AND status = 'sent' ORDER BY friendname LIMIT %s OFFSET %s;", (current_user, limit, offset))
+            cur.execute("SELECT friendname FROM friends WHERE username = %s AND status = 'sent' ORDER BY friendname LIMIT %s OFFSET %s;", (current_user, limit, offset))
         
-        results = cur.fetchall()
-        cur.close()
+            results = cur.fetchall()
+            cur.close()
 
-        return {"users": [x["friendname"] for x in results], "total": total_count}
+            return {"users": [x["friendname"] for x in results], "total": total_count}
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        conn.close()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/all")
 def search_users_all(current_user: str = Depends(get_current_user), page: int = 1, limit: int = 50):
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        offset = (page - 1) * limit
-
-        # Query for total count
-        cur.execute("(SELECT COUNT(*) FROM users WHERE username <> %s " \
-                    "AND username NOT IN (SELECT friendname FROM friends WHERE username = %s))", 
-                    (current_user, current_user))
-        total_count = cur.fetchone()['count']
-
-        # Query for paginated results
-        cur.execute("(SELECT username FROM users WHERE username <> %s " \
-                    "AND username NOT IN (SELECT friendname FROM friends WHERE username = %s)) " \
-                    "ORDER BY username LIMIT %s OFFSET %s", 
-                    (current_user, current_user, limit, offset))
-
-        results = cur.fetchall()
-        cur.close()
-
-        return {"users": [x["username"] for x in results], "total": total_count}
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    with pooled_connection() as conn:
+        try:
+            cur = conn.cursor()
+            offset = (page - 1) * limit
+
+            # Query for total count
+            cur.execute("(SELECT COUNT(*) FROM users WHERE username <> %s " \
+                        "AND username NOT IN (SELECT friendname FROM friends WHERE username = %s))", 
+                        (current_user, current_user))
+            total_count = cur.fetchone()['count']
+
+            # Query for paginated results
+            cur.execute("(SELECT username FROM users WHERE username <> %s " \
+                        "AND username NOT IN (SELECT friendname FROM friends WHERE username = %s)) " \
+                        "ORDER BY username LIMIT %s OFFSET %s", 
+                        (current_user, current_user, limit, offset))
+
+            results = cur.fetchall()
+            cur.close()
+
+            return {"users": [x["username"] for x in results], "total": total_count}
     
-    finally:
-        conn.close()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{user_id}")
 def search_users_by_id(user_id: str, current_user: str = Depends(get_current_user), page: int = 1, limit: int = 50):
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        offset = (page - 1) * limit
-        search_pattern = f"%{user_id}%"
-
-        # Query for total count
-        cur.execute("(SELECT COUNT(*) FROM users WHERE username LIKE %s " \
-                    "AND username <> %s AND username NOT IN (SELECT friendname FROM friends WHERE username = %s))", 
-                    (search_pattern, current_user, current_user))
-        total_count = cur.fetchone()['count']
-
-        # Query for paginated results
-        cur.execute("(SELECT username FROM users WHERE username LIKE %s " \
-                    "AND username <> %s AND username NOT IN (SELECT friendname FROM friends WHERE username = %s)) " \
-                    "ORDER BY username LIMIT %s OFFSET %s", 
-                    (search_pattern, current_user, current_user, limit, offset))
+    with pooled_connection() as conn:
+        try:
+            cur = conn.cursor()
+            offset = (page - 1) * limit
+            search_pattern = f"%{user_id}%"
+
+            # Query for total count
+            cur.execute("(SELECT COUNT(*) FROM users WHERE username LIKE %s " \
+                        "AND username <> %s AND username NOT IN (SELECT friendname FROM friends WHERE username = %s))", 
+                        (search_pattern, current_user, current_user))
+            total_count = cur.fetchone()['count']
+
+            # Query for paginated results
+            cur.execute("(SELECT username FROM users WHERE username LIKE %s " \
+                        "AND username <> %s AND username NOT IN (SELECT friendname FROM friends WHERE username = %s)) " \
+                        "ORDER BY username LIMIT %s OFFSET %s", 
+                        (search_pattern, current_user, current_user, limit, offset))
         
-        results = cur.fetchall()
-        cur.close()
+            results = cur.fetchall()
+            cur.close()
 
-        return {"users": [x["username"] for x in results], "total": total_count}
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            return {"users": [x["username"] for x in results], "total": total_count}
     
-    finally:
-        conn.close()
\ No newline at end of file
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi import APIRouter, HTTPException, Request, Depends, Query
 from pydantic import BaseModel
+from typing import List, Optional
 from database.db import execute_query
+from fastapi.responses import StreamingResponse
+from database.async_db import execute_query_async, execute_analytics_query_async, stream_query_async
 from datetime import date
 from routers.auth import get_current_user
-import pandas as pd
-from collections import defaultdict
 from redis_client import redis_client
+from services.analytics import betas, rolling_betas, cov_corr, complete_days, RollingCov, corr_from_cov, matrix_payload
+from services.streaming import STREAM_FORMATS, stream_format, ndjson_line
+from services.equity import equity_curve
+from services.cache import ANALYTICS_TTL, portfolio_symbols, symbol_set_key, get_per_symbol, set_per_symbol, mark_hot, hot_portfolios
+from services.ingest import MARKET_VERSION
+from services.singleflight import single_flight
+from services.trading import run_trade, run_orders
 import json
 
 router = APIRouter(
@@ -23,6 +31,15 @@ class Transaction(BaseModel):
     type: str
     shares: int
 
+class Order(BaseModel):
+    type: str
+    stock_symbol: Optional[str] = None
+    shares: int = 0
+    cash: float = 0
+
+class OrderBatch(BaseModel):
+    orders: List[Order]
+
 
 #Create Portfolio
 @router.post("/create")
@@ -55,138 +72,216 @@ def create_portfolio(current_user: str = Depends(get_current_user)):
 
 @router.get("/get-variance/{portfolio_id}")
 async def get_variance_portfolio(portfolio_id: int):
+    await mark_hot(portfolio_id)
+    return await portfolio_variance(portfolio_id)
 
-    cache_key = f"variance:{portfolio_id}"
 
-    cached = await redis_client.get(cache_key)
-    if cached:
-        return json.loads(cached)
+async def portfolio_variance(portfolio_id):
+    symbols, versions = await portfolio_symbols(portfolio_id)
+
+    result, missing = await get_per_symbol("variance", symbols, versions)
+    if not missing:
+        return result
     
-    prices = execute_query("""
+    prices = await execute_analytics_query_async("""
         SELECT symbol, VAR_SAMP(r) as var_samp, AVG(r) as avg_r
-        FROM (
-            SELECT symbol, close/LAG(close) OVER (PARTITION BY symbol ORDER BY timestamp)-1 AS r
-            FROM stocks
-            WHERE symbol IN (SELECT stock_symbol FROM portfolio_holdings WHERE portfolio_id = %s)
-        ) t
+        FROM stock_returns
+        WHERE symbol = ANY(%s)
         GROUP BY symbol
-    """, (portfolio_id,))
+    """, (missing,))
     
-    result = {p['symbol']: p['var_samp'] / p['avg_r'] for p in prices}
-    await redis_client.set(cache_key, json.dumps(result))
+    computed = {p['symbol']: p['var_samp'] / p['avg_r'] for p in prices}
+    await set_per_symbol("variance", computed, versions)
+    result.update(computed)
     return result
 
 
 @router.get("/get-beta/{portfolio_id}")
-async def get_beta_portfolio(portfolio_id: int):
-
-    cache_key = f"beta:{portfolio_id}"
-
-    cached = await redis_client.get(cache_key)
-    if cached:
-        return json.loads(cached)
-
-    stock_returns = execute_query("""
-        WITH per_stock_returns AS (
-            SELECT
-                timestamp,
-                symbol,
-                close / LAG(close) OVER (PARTITION BY symbol ORDER BY timestamp) - 1 AS r
-            FROM stocks
-            WHERE symbol IN (SELECT stock_symbol FROM portfolio_holdings WHERE portfolio_id = %s)
-        )
-        SELECT *
-        FROM per_stock_returns
-        WHERE r IS NOT NULL
+async def get_beta_portfolio(
+    portfolio_id: int,
+    window: int = Query(None, ge=2),
+    rolling: int = Query(None, ge=2),
+    step: int = Query(1, ge=1),
+):
+    """
+    Beta of each holding against the equal-weighted market.
+    window restricts to the last N trading days; rolling returns a rolling N-day
+    beta series per symbol, sampled every `step` days.
+    """
+    await mark_hot(portfolio_id)
+    return await portfolio_betas(portfolio_id, window, rolling, step)
+
+
+async def portfolio_betas(portfolio_id, window=None, rolling=None, step=1):
+    symbols, versions = await portfolio_symbols(portfolio_id)
+    # Beta also depends on the market series, so its version is part of every key
+    variant = f":{versions[MARKET_VERSION]}:{window}:{rolling}:{step}"
+
+    result, missing = await get_per_symbol("beta", symbols, versions, variant)
+    if not missing:
+        return result
+
+    stock_returns = await execute_analytics_query_async("""
+        SELECT timestamp, symbol, r
+        FROM stock_returns
+        WHERE symbol = ANY(%s)
         ORDER BY symbol, timestamp
-    """, (portfolio_id,))
-
-    market_returns = execute_query("""
-        WITH per_stock_returns AS (
-            SELECT
-                timestamp,
-                close / LAG(close) OVER (PARTITION BY symbol ORDER BY timestamp) - 1 AS r
-            FROM stocks
-        ),
-        market AS (
-            SELECT
-                timestamp,
-                AVG(r) AS market_r
-            FROM per_stock_returns
-            WHERE r IS NOT NULL
-            GROUP BY timestamp
-        )
-        SELECT *
-        FROM market
+    """, (missing,))
+
+    market_returns = await execute_analytics_query_async("""
+        SELECT timestamp, market_r
+        FROM market_returns
         ORDER BY timestamp
     """)
 
     if not stock_returns or not market_returns:
         raise HTTPException(status_code=404, detail=f"No returns found for portfolio '{portfolio_id}' or market")
 
-    market_dict = {r['timestamp']: r['market_r'] for r in market_returns}
+    if rolling:
+        computed = rolling_betas(stock_returns, market_returns, rolling, window, step)
+    else:
+        computed = betas(stock_returns, market_returns, window)
 
+    await set_per_symbol("beta", computed, versions, variant)
+    result.update(computed)
 
-    betas = {}
-    grouped = defaultdict(list)
-    for row in stock_returns:
-        if row['timestamp'] in market_dict:
-            grouped[row['symbol']].append((row['r'], market_dict[row['timestamp']]))
+    return result
 
-    for symbol, data in grouped.items():
-        n = len(data)
-        stock_rs = [r[0] for r in data]
-        market_rs = [r[1] for r in data]
-        mean_stock = sum(stock_rs) / n
-        mean_market = sum(market_rs) / n
 
-        cov = sum((stock_rs[i] - mean_stock) * (market_rs[i] - mean_market) for i in range(n)) / (n - 1)
-        var_market = sum((market_rs[i] - mean_market) ** 2 for i in range(n)) / (n - 1)
+async def stream_cov_corr(symbols, window, rolling, step, format):
+    """
+    Rolling matrices as NDJSON: a {"symbols": [...]} line, then one line per sampled
+    date, computed while the returns are read from a server-side cursor so memory
+    stays at one window whatever the history length.
+    """
+    start = None
+    if window:
+        # First of the last `window` dates on which every holding has a return
+        rows = await execute_analytics_query_async("""
+            SELECT timestamp FROM stock_returns
+            WHERE symbol = ANY(%s)
+            GROUP BY timestamp
+            HAVING COUNT(*) = %s
+            ORDER BY timestamp DESC
+            LIMIT 1 OFFSET %s
+        """, (symbols, len(symbols), window - 1))
+        start = rows[0]["timestamp"] if rows else None
 
-        betas[symbol] = cov / var_market if var_market != 0 else None
+    rows = stream_query_async("""
+        SELECT timestamp, symbol, r
+        FROM stock_returns
+        WHERE symbol = ANY(%s) AND (%s::date IS NULL OR timestamp >= %s::date)
+        ORDER BY timestamp, symbol;
+    """, (symbols, start, start))
 
-    await redis_client.set(cache_key, json.dumps(betas))
+    async def lines():
+        yield ndjson_line({"symbols": symbols})
+        roll = RollingCov(rolling, step)
+        async for day, x in complete_days(rows, symbols):
+            cov = roll.push(x)
+            if cov is not None:
+                yield ndjson_line({"date": str(day)[:10], **matrix_payload(symbols, cov, corr_from_cov(cov), format)})
 
-    return betas
+    return StreamingResponse(lines(), media_type=STREAM_FORMATS["ndjson"])
 
 
 @router.get("/get-cov-corr/{portfolio_id}")
-async def get_cov_corr(portfolio_id: int):
+async def get_cov_corr(
+    portfolio_id: int,
+    request: Request,
+    window: int = Query(None, ge=2),
+    rolling: int = Query(None, ge=2),
+    step: int = Query(1, ge=1),
+    format: str = "json",
+    allow_stale: bool = False,
+    stream: str = None,
+):
+    """
+    Covariance and correlation matrices of the holdings' daily returns.
+    window restricts to the last N common trading days; rolling returns one pair of
+    N-day matrices every `step` days (e.g. rolling=60&step=5 for weekly samples).
+    format=compact returns a symbol index plus base64 float32 upper triangles.
+    stream=ndjson (or Accept: application/x-ndjson) with rolling streams the series
+    line by line straight from the database instead of building and caching it.
+    The result is cached by symbol set and data versions, so portfolios holding the
+    same symbols share it and new prices are picked up without explicit deletes.
+    On a miss only one worker computes the matrices; with allow_stale the last result
+    for the same symbol set is served while it is refreshed.
+    """
+    if format not in ("json", "compact"):
+        raise HTTPException(status_code=400, detail="format must be json or compact")
 
-    cache_key = f"matrix:{portfolio_id}"
+    fmt = stream_format(request, stream, allowed=("ndjson",))
+    if fmt and not rolling:
+        raise HTTPException(status_code=400, detail="Streaming needs rolling")
 
-    cached = await redis_client.get(cache_key)
-    if cached:
-        return json.loads(cached)
-    
-    rows = execute_query("""
-        WITH all_returns AS (
-            SELECT
-                stocks.timestamp,
-                stocks.symbol,
-                close / LAG(close) OVER (
-                    PARTITION BY stocks.symbol ORDER BY stocks.timestamp
-                ) - 1 AS r
-            FROM stocks JOIN portfolio_holdings ON stocks.symbol = portfolio_holdings.stock_symbol
-            WHERE portfolio_holdings.portfolio_id = %s
-        )
-        SELECT timestamp, symbol, r
-        FROM all_returns
-        WHERE r IS NOT NULL
-        ORDER BY timestamp, symbol;
-    """, (portfolio_id, ))
+    await mark_hot(portfolio_id)
+    if fmt:
+        symbols, _ = await portfolio_symbols(portfolio_id)
+        if len(symbols) < 2:
+            return {"covariance_matrix": {}, "correlation_matrix": {}}
+        return await stream_cov_corr(symbols, window, rolling, step, format)
+
+    return await portfolio_cov_corr(portfolio_id, window, rolling, step, format, allow_stale)
 
-    df = pd.DataFrame(rows)
-    if df.empty or df['symbol'].nunique() < 2:
+
+async def portfolio_cov_corr(portfolio_id, window=None, rolling=None, step=1, format="json", allow_stale=False):
+    symbols, versions = await portfolio_symbols(portfolio_id)
+    if len(symbols) < 2:
         return {"covariance_matrix": {}, "correlation_matrix": {}}
-    pivot = df.pivot(index="timestamp", columns="symbol", values="r").dropna()
 
-    cov_matrix = pivot.cov()
-    corr_matrix = pivot.corr()
-    result = {"covariance_matrix": cov_matrix.to_dict(), "correlation_matrix": corr_matrix.to_dict()}
-    await redis_client.set(cache_key, json.dumps(result))
+    cache_key = f"matrix:{symbol_set_key(symbols, versions)}"
+    stale_key = f"matrix:stale:{symbol_set_key(symbols, {})}"
+    variant = f"{window}:{rolling}:{step}:{format}"
 
-    return result
+    async def get_cached():
+        cached = await redis_client.hget(cache_key, variant)
+        return json.loads(cached) if cached else None
+
+    async def compute():
+        rows = await execute_analytics_query_async("""
+            SELECT timestamp, symbol, r
+            FROM stock_returns
+            WHERE symbol = ANY(%s)
+            ORDER BY timestamp, symbol;
+        """, (symbols, ))
+
+        if len({r["symbol"] for r in rows}) < 2:
+            return {"covariance_matrix": {}, "correlation_matrix": {}}
+
+        result = cov_corr(rows, window, rolling, step, format)
+        payload = json.dumps(result)
+        await redis_client.hset(cache_key, variant, payload)
+        await redis_client.expire(cache_key, ANALYTICS_TTL)
+        await redis_client.hset(stale_key, variant, payload)
+        await redis_client.expire(stale_key, ANALYTICS_TTL)
+        return result
+
+    result = await get_cached()
+    if result is not None:
+        return result
+
+    stale = None
+    if allow_stale:
+        cached = await redis_client.hget(stale_key, variant)
+        stale = json.loads(cached) if cached else None
+
+    return await single_flight(f"{cache_key}:{variant}", compute, get_cached, stale)
+
+
+async def recompute_hot_portfolios():
+    """
+    Warm the default variance / beta / matrix entries of the most read portfolios
+    after new prices were written, so their next page load is a cache hit.
+    Goes around the handlers so warming does not count as a read.
+    """
+    for portfolio_id in await hot_portfolios():
+        try:
+            await portfolio_variance(portfolio_id)
+            await portfolio_betas(portfolio_id)
+            await portfolio_cov_corr(portfolio_id)
+        except Exception as e:
+            print(f"Recompute for portfolio {portfolio_id} failed:", e)
 
 
 # Endpoint to get all owned portfolios
@@ -220,14 +315,7 @@ def get_stocks_in_portfolio(portfolio_id: int, current_user: str = Depends(get_c
             ON p.portfolio_id = po.portfolio_id
         JOIN portfolio_holdings ph 
             ON p.portfolio_id = ph.portfolio_id
-        JOIN (
-            SELECT DISTINCT ON (symbol)
-                symbol,
-                close,
-                timestamp
-            FROM stocks
-            ORDER BY symbol, timestamp DESC
-        ) AS s
+        JOIN latest_prices s
             ON s.symbol = ph.stock_symbol
         WHERE p.portfolio_id = %s
         AND po.username = %s;
@@ -247,177 +335,54 @@ def get_stocks_in_portfolio(portfolio_id: int, current_user: str = Depends(get_c
 @router.post("/{portfolio_id}/transcation")
 async def portfolio_transcation(portfolio_id: int, transaction: Transaction, current_user: str = Depends(get_current_user)):
 
-    queries = []
-    params = []
+    today = date.today().strftime("%Y-%m-%d")
+
+    # Checks, locks and writes all happen in one statement, so a trade is atomic
+    # and concurrent trades cannot overdraw cash or oversell shares
+    result = await run_trade(
+        portfolio_id,
+        transaction.type,
+        transaction.cash,
+        transaction.stock_symbol,
+        transaction.shares,
+        current_user,
+        today,
+    )
+
+    response = {"message": "Transcation successful.", "cash": result["cash"]}
+    if transaction.type in ("stock_buy", "stock_sell"):
+        response["price"] = result["price"]
+        response["holding"] = {"stock_symbol": transaction.stock_symbol, "shares": result["shares"]}
+    return response
+
+
+# Endpoint to fill several legs at once, e.g. a full rebalance.
+# Legs are applied in the order given, so put sells before the buys they fund.
+@router.post("/{portfolio_id}/orders")
+async def portfolio_orders(portfolio_id: int, batch: OrderBatch, current_user: str = Depends(get_current_user)):
+
+    if not batch.orders:
+        raise HTTPException(status_code=400, detail="No orders given")
 
     today = date.today().strftime("%Y-%m-%d")
+    result = await run_orders(portfolio_id, batch.orders, current_user, today)
 
-    # Handle transaction types
-    if transaction.type == "cash_deposit":
-        queries.append("UPDATE portfolio SET cash = cash + %s WHERE portfolio_id = %s;")
-        params.append((transaction.cash, portfolio_id))
-
-        queries.append("""
-            INSERT INTO transaction (amount, type, timestamp, portfolio_id, username) 
-            VALUES (%s, %s, %s, %s, %s);
-        """)
-        params.append((transaction.cash, "cash_deposit", today, portfolio_id, current_user))
-
-    elif transaction.type == 'cash_withdraw':
-        # First, check current cash balance
-        balance_query = "SELECT cash FROM portfolio WHERE portfolio_id = %s;"
-        result = execute_query(balance_query, (portfolio_id,))
-        
-        if not result:
-            raise HTTPException(status_code=404, detail="Portfolio not found")
-
-        current_cash = result[0]['cash']
-
-        if current_cash < transaction.cash:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Insufficient funds: current balance is {current_cash}"
-            )
-
-        queries.append("""
-                UPDATE portfolio SET cash = cash - %s WHERE portfolio_id = %s;
-            """)
-        params.append((transaction.cash, portfolio_id))
-
-        queries.append("""
-            INSERT INTO transaction (amount, type, timestamp, portfolio_id, username)
-                VALUES (%s, %s, %s, %s, %s);
-            """)
-        params.append((-transaction.cash, "cash_withdraw", today, portfolio_id, current_user))
-
-
-    elif transaction.type == 'stock_buy':
-         # First, check current cash balance
-        balance_query = "SELECT cash FROM portfolio WHERE portfolio_id = %s;"
-        result = execute_query(balance_query, (portfolio_id,))
-        
-        if not result:
-            raise HTTPException(status_code=404, detail="Portfolio not found")
-
-        current_cash = result[0]['cash']
-
-        
-        price_query = "SELECT close FROM stocks WHERE symbol = %s ORDER BY timestamp DESC LIMIT 1;"
-        price_result = execute_query(price_query, (transaction.stock_symbol,), fetch=True)
-
-        if not price_result or "close" not in price_result[0]:
-                raise HTTPException(status_code=404, detail=f"No price found for {transaction.stock_symbol}")
-
-        price = price_result[0]["close"]
-        total_cost = transaction.shares * price
-
-        if current_cash < total_cost:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Insufficient funds: current balance is {current_cash}"
-            )
-        
-        queries.append("UPDATE portfolio SET cash = cash - %s WHERE portfolio_id = %s;")
-        params.append((total_cost, portfolio_id))
-
-        queries.append("""
-            INSERT INTO portfolio_holdings (portfolio_id, stock_symbol, shares) VALUES (%s, %s, %s)
-            ON CONFLICT (portfolio_id, stock_symbol)
-            DO UPDATE SET
-                shares = portfolio_holdings.shares + EXCLUDED.shares
-        """)
-        params.append((portfolio_id, transaction.stock_symbol, transaction.shares))
-
-        queries.append("""
-            INSERT INTO transaction (amount, type, timestamp, portfolio_id, username, stock_symbol, shares)
-            VALUES (%s, %s, %s, %s, %s, %s, %s);
-        """)
-        params.append((-total_cost, "stock_buy", today, portfolio_id, current_user,
-                       transaction.stock_symbol, transaction.shares))
-        
-        await redis_client.delete(f"matrix:{portfolio_id}")
-        await redis_client.delete(f"beta:{portfolio_id}")
-        await redis_client.delete(f"variance:{portfolio_id}")
-
-        
-    else:
-        price_query = """
-            SELECT close 
-            FROM stocks 
-            WHERE symbol = %s 
-            ORDER BY timestamp DESC 
-            LIMIT 1;
-        """
-        price_result = execute_query(price_query, (transaction.stock_symbol,), fetch=True)
-
-        if not price_result or "close" not in price_result[0]:
-                raise HTTPException(status_code=404, detail=f"No price found for {transaction.stock_symbol}")
-
-        price = price_result[0]["close"]
-        total_cost = transaction.shares * price
-
-        holding_query = """
-            SELECT shares FROM portfolio_holdings 
-            WHERE portfolio_id = %s AND stock_symbol = %s;
-        """
-        holding_result = execute_query(holding_query, (portfolio_id, transaction.stock_symbol), fetch=True)
-
-        if not holding_result:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"You don't own any shares of {transaction.stock_symbol} to sell."
-            )
-
-        current_shares = holding_result[0]["shares"]
-
-        if current_shares < transaction.shares:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Not enough shares to sell: you own {current_shares}, tried to sell {transaction.shares}."
-            )
-
-        queries.append("UPDATE portfolio SET cash = cash + %s WHERE portfolio_id = %s;")
-        params.append((total_cost, portfolio_id))
-
-
-        if current_shares == transaction.shares:
-            queries.append("""
-                DELETE FROM portfolio_holdings
-                WHERE portfolio_id = %s AND stock_symbol = %s;
-            """)
-            params.append((portfolio_id, transaction.stock_symbol))
-
-        else:
-            queries.append("""
-                UPDATE portfolio_holdings
-                SET shares = shares - %s
-                WHERE portfolio_id = %s AND stock_symbol = %s;
-            """)
-            params.append((transaction.shares, portfolio_id, transaction.stock_symbol))
-
-      
-        queries.append("""
-            INSERT INTO transaction (amount, type, timestamp, portfolio_id, username, stock_symbol, shares)
-            VALUES (%s, %s, %s, %s, %s, %s, %s);
-        """)
-        params.append((total_cost, "stock_sell", today, portfolio_id, current_user,
-                    transaction.stock_symbol, transaction.shares))
-        
-        await redis_client.delete(f"matrix:{portfolio_id}")
-        await redis_client.delete(f"beta:{portfolio_id}")
-        await redis_client.delete(f"variance:{portfolio_id}")
-
-    try:
-        for query,para in zip(queries, params):
-            execute_query(
-                query,
-                para,
-                fetch=False
-            )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Database insert error: {str(e)}"
-        )
-
-    return {"message": "Transcation successful."}
\ No newline at end of file
+    return {"message": "Orders filled.", **result}
+
+
+# Endpoint for the daily value of a portfolio (equity curve)
+@router.get("/{portfolio_id}/equity")
+async def get_portfolio_equity(
+    portfolio_id: int,
+    start: date = Query(None, alias="from"),
+    end: date = Query(None, alias="to"),
+    current_user: str = Depends(get_current_user)
+):
+
+    owned = await execute_query_async("""
+        SELECT 1 FROM portfolio_owned WHERE portfolio_id = %s AND username = %s
+    """, (portfolio_id, current_user))
+    if not owned:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+
+    return {"portfolio_id": portfolio_id, "series": await equity_curve(portfolio_id, start, end)}
@@ -1,18 +1,29 @@
-from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi import APIRouter, HTTPException, Request, Depends, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from database.db import execute_query
+from database.db import execute_query, stream_query, fetch_columns
+from database.async_db import execute_query_async, execute_analytics_query_async
+from services.downsample import parse_fields, range_clause, downsample
+from services.streaming import stream_format, stream_rows, peek
+from services.columnar import COLUMNS_MEDIA_TYPE, EPOCH_DAYS_SQL, wants_columns, columnar_payload, rows_to_columns
+from fastapi.responses import JSONResponse
+from services.ingest import daily_series_url, latest_timestamps, resolve_outputsize, parse_daily_series, bulk_upsert_stocks
+from services import refresh
+from services.cache import data_versions, symbol_version
+from services.l1cache import l1, cached_get, cached_set, invalidate
+from services.singleflight import single_flight
+from routers.portfolio import recompute_hot_portfolios
+from services.forecast import get_model_state, load_model_state, forecast_from_state, prediction_points
+import requests
 from datetime import date
-import requests, os
 import pandas as pd
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from datetime import timedelta
-from datetime import date
 import json
+import asyncio
 from redis_client import redis_client
 
 class PredictionResponse(BaseModel):
     symbol: str
-    history: list
+    history: list = []
     prediction: list
 
 router = APIRouter(
@@ -24,6 +35,16 @@ class StockRequest(BaseModel):
     timestamp: str
     symbol: str
 
+class RefreshRequest(BaseModel):
+    symbols: list[str] = []
+    rate_per_minute: int = None
+    concurrency: int = None
+    outputsize: str = "auto"
+
+class BatchPredictionRequest(BaseModel):
+    symbols: list[str]
+    horizons: list[int] = [30]
+
 class StockAdd(BaseModel):
     timestamp: str
     symbol: str
@@ -36,8 +57,12 @@ class StockAdd(BaseModel):
 
 @router.get("")
 def list_allStocks_bySymbol():
-    query = ("SELECT symbol FROM stocks GROUP BY symbol ORDER BY symbol")
-    results = execute_query(query)
+    results = l1.get("stocks:symbols")
+    if results is None:
+        query = ("SELECT symbol FROM stocks GROUP BY symbol ORDER BY symbol")
+        results = execute_query(query)
+        if results:
+            l1.set("stocks:symbols", results, len(json.dumps(results)), ttl=300)
 
     if not results:
         raise HTTPException(status_code=404, detail=f"No stocks found")
@@ -45,153 +70,294 @@ def list_allStocks_bySymbol():
     return {"result": results}
 
 
+# Most symbols one history request may ask for
+MAX_HISTORY_SYMBOLS = 100
+
+
+# Endpoint to get the history of several symbols at once (declared before /{symbol})
+@router.get("/history")
+def get_stocks_history(
+    symbols: str,
+    start: date = Query(None, alias="from"),
+    end: date = Query(None, alias="to"),
+    interval: str = None,
+    fields: str = None,
+    points: int = Query(None, ge=3),
+    method: str = "lttb",
+):
+    """
+    Same range, fields and downsampling options as /{symbol}, applied to every
+    symbol, fetched with one query. Returns {"result": {symbol: rows}}; symbols
+    without rows map to an empty list.
+    """
+    requested = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))
+    if not requested:
+        raise HTTPException(status_code=400, detail="No symbols given")
+    if len(requested) > MAX_HISTORY_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_HISTORY_SYMBOLS} symbols per request")
+
+    columns = parse_fields(fields)
+    selected = columns if "symbol" in columns else columns + ["symbol"]
+    # Each symbol's interval is anchored on its own latest_prices row, joined once
+    clauses, params = range_clause(interval, start, end, "lp.timestamp", column="s.timestamp")
+
+    query = (
+        f"SELECT {', '.join('s.' + c for c in selected)} "
+        "FROM latest_prices lp JOIN stocks s ON s.symbol = lp.symbol WHERE "
+        + " AND ".join(["lp.symbol = ANY(%s)"] + clauses)
+        + " ORDER BY s.symbol, s.timestamp ASC;"
+    )
+    results = execute_query(query, (requested, *params))
+
+    if not results:
+        raise HTTPException(status_code=404, detail="No stocks found for the given symbols")
+
+    grouped = {s: [] for s in requested}
+    for row in results:
+        grouped[row["symbol"]].append(row)
+    if "symbol" not in columns:
+        for rows in grouped.values():
+            for row in rows:
+                del row["symbol"]
+
+    return {"result": {s: downsample(rows, points, method) for s, rows in grouped.items()}}
+
+
 # Endpoint to get stocks by symbol
 @router.get("/{symbol}")
-def get_stocks_by_symbol(symbol: str, request: Request):
-    query = ("SELECT * FROM stocks WHERE symbol=%s ORDER BY timestamp ASC;")
-    results = execute_query(query, (symbol,))
+def get_stocks_by_symbol(
+    symbol: str,
+    request: Request,
+    start: date = Query(None, alias="from"),
+    end: date = Query(None, alias="to"),
+    interval: str = None,
+    fields: str = None,
+    points: int = Query(None, ge=3),
+    method: str = "lttb",
+    stream: str = None,
+    format: str = None,
+):
+    columns = parse_fields(fields)
+    clauses, params = range_clause(
+        interval, start, end, "(SELECT timestamp FROM latest_prices WHERE symbol = %s)", (symbol,)
+    )
+    fmt = stream_format(request, stream)
+    where = " AND ".join(["symbol=%s"] + clauses)
+
+    # Columnar: typed columns straight from a tuple cursor, packed with numpy
+    if not fmt and wants_columns(request, format):
+        if points:
+            results = execute_query(f"SELECT {', '.join(columns)} FROM stocks WHERE {where} ORDER BY timestamp ASC;", (symbol, *params))
+            data = rows_to_columns(downsample(results, points, method), columns) if results else {}
+        else:
+            selected = [EPOCH_DAYS_SQL if c == "timestamp" else c for c in columns if c != "symbol"]
+            data = fetch_columns(f"SELECT {', '.join(selected)} FROM stocks WHERE {where} ORDER BY timestamp ASC;", (symbol, *params))
+        if not data:
+            raise HTTPException(status_code=404, detail=f"No stocks found for symbol '{symbol}'")
+        return JSONResponse(columnar_payload(symbol, data), media_type=COLUMNS_MEDIA_TYPE)
+
+    query = f"SELECT {', '.join(columns)} FROM stocks WHERE {where} ORDER BY timestamp ASC;"
+
+    # Streamed rows come straight off a server-side cursor unless they need downsampling
+    if fmt and not points:
+        first, rows = peek(stream_query(query, (symbol, *params)))
+        if first is None:
+            raise HTTPException(status_code=404, detail=f"No stocks found for symbol '{symbol}'")
+        return stream_rows(rows, fmt)
+
+    results = execute_query(query, (symbol, *params))
 
     if not results:
         raise HTTPException(status_code=404, detail=f"No stocks found for symbol '{symbol}'")
 
-    return {"result": results}
+    if fmt:
+        return stream_rows(downsample(results, points, method), fmt)
+    return {"result": downsample(results, points, method)}
+
+
+async def after_stock_write(symbols):
+    await invalidate("stocks:symbols", *[f"version:{s}" for s in symbols])
+    await recompute_hot_portfolios()
 
 
 # Endpoint to update daily stocks information (manual)
 @router.post("/update")
-def add_stock(stock: StockAdd):
-    query = """
-        INSERT INTO stocks VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (timestamp, symbol)
-        DO UPDATE SET
-            open = EXCLUDED.open, close = EXCLUDED.close, high = EXCLUDED.high, low = EXCLUDED.low, volume = EXCLUDED.volume
-    """
-
-    try:
-        execute_query(
-            query,
-            (
-                stock.timestamp,
-                stock.open,
-                stock.high,
-                stock.low,
-                stock.close,
-                stock.volume,
-                stock.symbol,
-            ),
-            fetch=False
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Database insert error: {str(e)}"
-        )
-
-    return {"message": "Stock data updated successfully"}
+def add_stock(stock: StockAdd, background_tasks: BackgroundTasks):
+    counts = bulk_upsert_stocks([(
+        stock.timestamp,
+        stock.open,
+        stock.high,
+        stock.low,
+        stock.close,
+        stock.volume,
+        stock.symbol,
+    )])
+    if counts["inserted"] or counts["updated"]:
+        background_tasks.add_task(after_stock_write, [stock.symbol])
+
+    return {"message": "Stock data updated successfully", **counts}
 
 
 # Endpoint to update daily stocks information (manual)
 @router.post("/update/{symbol}")
-def add_stock(symbol: str):
-
-    api_key = os.getenv("AlphaVantageAPI_KEY")
+def add_stock(symbol: str, background_tasks: BackgroundTasks, outputsize: str = "auto"):
 
-    url = (
-        f'https://www.alphavantage.co/query?'
-        f'function=TIME_SERIES_DAILY&'
-        f'symbol={symbol}&'
-        f'apikey={api_key}'
-    )
+    latest = latest_timestamps([symbol]).get(symbol)
+    url = daily_series_url(symbol, resolve_outputsize(outputsize, latest))
     r = requests.get(url)
     data = r.json()
 
-    dailyData = data["Time Series (Daily)"]
+    rows = parse_daily_series(symbol, data)
+    counts = bulk_upsert_stocks(rows)
+    if counts["inserted"] or counts["updated"]:
+        background_tasks.add_task(after_stock_write, [symbol])
 
-    for date in dailyData:
-        query = """
-            INSERT INTO stocks VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (timestamp, symbol)
-            DO UPDATE SET
-                open = EXCLUDED.open, close = EXCLUDED.close, high = EXCLUDED.high, low = EXCLUDED.low, volume = EXCLUDED.volume
-        """
+    return {"message": "Stock data updated successfully", **counts}
 
-        try:
-            execute_query(
-                query,
-                (
-                    date,
-                    dailyData[date]["1. open"],
-                    dailyData[date]["2. high"],
-                    dailyData[date]["3. low"],
-                    dailyData[date]["4. close"],
-                    dailyData[date]["5. volume"],
-                    symbol,
-                ),
-                fetch=False
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Database insert error: {str(e)}"
-            )
 
-    return {"message": "Stock data updated successfully"}
+# Endpoint to refresh many symbols in the background (all stored symbols if none given)
+@router.post("/refresh")
+async def start_refresh(req: RefreshRequest):
+    symbols = [s.upper() for s in req.symbols] or await asyncio.to_thread(refresh.all_symbols)
+    if not symbols:
+        raise HTTPException(status_code=404, detail="No stocks found")
 
+    resolve_outputsize(req.outputsize, None)
+    latest = await asyncio.to_thread(latest_timestamps, symbols)
 
-@router.get("/{symbol}/predict", response_model=PredictionResponse)
-async def predict_stock(symbol: str, days: int = 30):
-    """
-    Predict future close prices using Holt-Winters Exponential Smoothing.
-    """
+    job = await refresh.start_refresh(symbols, req.rate_per_minute, req.concurrency, req.outputsize, latest,
+                                      on_done=recompute_hot_portfolios)
+    return {"job_id": job["job_id"], "total": job["total"]}
 
-    cache_key = f"prediction:{symbol}:{days}"
 
-    cached = await redis_client.get(cache_key)
-    if cached:
-        return json.loads(cached)
+# Endpoint to check progress and per-symbol status of a refresh job
+@router.get("/refresh/{job_id}")
+async def get_refresh_status(job_id: str):
+    job = await refresh.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"No refresh job '{job_id}'")
+    return job
 
-    query = """
-        SELECT timestamp, close
-        FROM stocks
-        WHERE symbol = %s
-        ORDER BY timestamp ASC;
+
+def history_points(df, window=None):
     """
-    rows = execute_query(query, (symbol,))
+    Trailing `window` closes of df (all when None) as date/close points, converted
+    column-wise instead of row by row.
+    """
+    if window is not None:
+        df = df.iloc[-window:] if window > 0 else df.iloc[:0]
+    return [
+        {"date": d, "close": c}
+        for d, c in zip(df.index.strftime("%Y-%m-%d"), df["close"].astype("float64").tolist())
+    ]
 
-    if not rows or len(rows) < 10:
-        raise HTTPException(status_code=400, detail="Not enough data to predict.")
 
+def history_frame(rows):
     df = pd.DataFrame(rows, columns=["timestamp", "close"])
     df["timestamp"] = pd.to_datetime(df["timestamp"])
     df.set_index("timestamp", inplace=True)
+    return df
 
-    model = ExponentialSmoothing(
-        df["close"],
-        trend="add",
-        seasonal=None,
-        initialization_method="estimated"
-    ).fit()
 
-    forecast = model.forecast(days)
-    last_date = pd.Timestamp(date.today())
-    future_dates = [(last_date + timedelta(days=i+1)).strftime("%Y-%m-%d") for i in range(days)]
+@router.post("/predict/batch")
+async def predict_batch(req: BatchPredictionRequest):
+    """
+    Forecast many symbols at once. Each symbol's model is fitted at most once on the
+    process pool (or reused from the model cache) and serves every requested horizon.
+    Results stream back as NDJSON lines as soon as each symbol finishes.
+    """
+    symbols = list(dict.fromkeys(s.upper() for s in req.symbols))
+    horizons = sorted(set(req.horizons))
+    if not symbols or not horizons or min(horizons) < 1:
+        raise HTTPException(status_code=400, detail="Need at least one symbol and positive horizons")
 
-    prediction = [
-        {"date": str(future_dates[i]), "predicted_close": float(forecast.iloc[i])}
-        for i in range(days)
-    ]
+    rows = await execute_analytics_query_async("""
+        SELECT symbol, timestamp, close
+        FROM stocks
+        WHERE symbol = ANY(%s)
+        ORDER BY symbol, timestamp ASC;
+    """, (symbols,))
 
-    history = [
-        {"date": str(idx.date()), "close": float(row.close)}
-        for idx, row in df.iterrows()
-    ]
+    versions = await data_versions(symbols)
+
+    grouped = {s: [] for s in symbols}
+    for row in rows:
+        grouped[row["symbol"]].append(row)
+
+    async def predict_one(symbol):
+        history = grouped[symbol]
+        if len(history) < 10:
+            return {"symbol": symbol, "error": "Not enough data to predict."}
+
+        df = history_frame(history)
+        try:
+            state = await get_model_state(symbol, versions[symbol], df.index, df["close"].tolist())
+        except Exception as e:
+            return {"symbol": symbol, "error": str(e)}
+        forecast = forecast_from_state(state, horizons[-1])
+
+        predictions = {}
+        for days in horizons:
+            prediction = prediction_points(forecast, days)
+            await redis_client.set(f"forecast:{symbol}:{versions[symbol]}:{days}", json.dumps(prediction), ex=6 * 3600)
+            predictions[days] = prediction
+
+        return {"symbol": symbol, "predictions": predictions}
 
-    result = {
-        "symbol": symbol,
-        "history": history,
-        "prediction": prediction
-    }
+    async def stream():
+        for finished in asyncio.as_completed([predict_one(s) for s in symbols]):
+            yield json.dumps(await finished) + "\n"
 
-    await redis_client.set(cache_key, json.dumps(result), ex=6 * 3600)
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
-    return result
+
+@router.get("/{symbol}/predict", response_model=PredictionResponse)
+async def predict_stock(symbol: str, days: int = 30, history: int = Query(None, ge=0), allow_stale: bool = False):
+    """
+    Predict future close prices using Holt-Winters Exponential Smoothing.
+    `history` limits the returned history to the trailing N closes (0 for forecast only);
+    omitted, the full history is returned as before.
+    Only the forecast is cached; history is read from stocks when asked for.
+    On a cache miss only one worker computes the forecast; with allow_stale the last
+    forecast computed for any data version is served while it is refreshed.
+    """
+
+    version = await symbol_version(symbol)
+    cache_key = f"forecast:{symbol}:{version}:{days}"
+    stale_key = f"forecast:{symbol}:{days}:stale"
+
+    async def get_cached():
+        return await cached_get(cache_key)
+
+    async def compute():
+        # Reads no price rows at all when the stored model matches this version
+        state = await load_model_state(symbol, version)
+        prediction = prediction_points(forecast_from_state(state, days), days)
+
+        await cached_set(cache_key, prediction, ex=6 * 3600)
+        await redis_client.set(stale_key, json.dumps(prediction), ex=7 * 24 * 3600)
+        return prediction
+
+    prediction = await get_cached()
+    if prediction is None:
+        stale = None
+        if allow_stale:
+            cached = await redis_client.get(stale_key)
+            stale = json.loads(cached) if cached else None
+        prediction = await single_flight(cache_key, compute, get_cached, stale)
+
+    if history == 0:
+        return {"symbol": symbol, "history": [], "prediction": prediction}
+
+    query = """
+        SELECT timestamp, close FROM (
+            SELECT timestamp, close
+            FROM stocks
+            WHERE symbol = %s
+            ORDER BY timestamp DESC
+            LIMIT %s
+        ) t
+        ORDER BY timestamp ASC;
+    """
+    rows = await execute_query_async(query, (symbol, history))
+    return {"symbol": symbol, "history": history_points(history_frame(rows)), "prediction": prediction}
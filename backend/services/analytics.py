@@ -0,0 +1,200 @@
+import base64
+from collections import deque
+import numpy as np
+import pandas as pd
+
+
+def returns_matrix(rows):
+    """
+    Pivot (timestamp, symbol, r) rows into a date x symbol frame of returns,
+    NaN where a symbol has no return that day.
+    """
+    df = pd.DataFrame(rows, columns=["timestamp", "symbol", "r"])
+    return df.pivot(index="timestamp", columns="symbol", values="r").sort_index().astype("float64")
+
+
+def market_series(rows):
+    df = pd.DataFrame(rows, columns=["timestamp", "market_r"])
+    return df.set_index("timestamp")["market_r"].astype("float64")
+
+
+def align(stock_rows, market_rows, window=None):
+    """
+    Align every holding on the market's dates, keeping only the last `window` market
+    dates when given. Each symbol's result depends only on its own returns and the
+    market, so results can be cached per symbol.
+    """
+    market = market_series(market_rows)
+    if window:
+        market = market.iloc[-window:]
+    returns = returns_matrix(stock_rows).reindex(market.index)
+    return returns, market
+
+
+def betas(stock_rows, market_rows, window=None):
+    """
+    Beta of every holding against the market in one vectorized pass. Each symbol
+    uses only the dates on which it has a return (sample covariance / variance).
+    """
+    returns, market = align(stock_rows, market_rows, window)
+    R = returns.to_numpy()
+    m = market.to_numpy()[:, None]
+
+    mask = ~np.isnan(R)
+    n = mask.sum(axis=0)
+    R0 = np.where(mask, R, 0.0)
+    M0 = np.where(mask, m, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_s = R0.sum(axis=0) / n
+        mean_m = M0.sum(axis=0) / n
+        dm = np.where(mask, m - mean_m, 0.0)
+        cov = (np.where(mask, R - mean_s, 0.0) * dm).sum(axis=0) / (n - 1)
+        var_m = (dm ** 2).sum(axis=0) / (n - 1)
+        beta = cov / var_m
+
+    return {
+        symbol: (float(b) if np.isfinite(b) and var_m[i] != 0 else None)
+        for i, (symbol, b) in enumerate(zip(returns.columns, beta))
+    }
+
+
+def rolling_betas(stock_rows, market_rows, rolling, window=None, step=1):
+    """
+    Rolling `rolling`-day beta of every holding, sampled every `step` dates.
+    """
+    returns, market = align(stock_rows, market_rows, window)
+    cov = returns.rolling(rolling, min_periods=rolling).cov(market)
+    var_m = market.rolling(rolling, min_periods=rolling).var()
+    beta = cov.div(var_m.replace(0, np.nan), axis=0).iloc[rolling - 1::step]
+
+    dates = [str(d)[:10] for d in beta.index]
+    return {
+        symbol: [
+            {"date": d, "beta": (None if np.isnan(b) else float(b))}
+            for d, b in zip(dates, beta[symbol].to_numpy())
+        ]
+        for symbol in beta.columns
+    }
+
+
+class RollingCov:
+    """
+    Sliding-window sample covariance fed one return vector (one date, no NaN) at a
+    time. Keeps running sums of x and x x^T and updates them with one row in and one
+    row out per date instead of recomputing each window, holding only the window.
+    """
+
+    def __init__(self, rolling, step=1):
+        self.rolling = rolling
+        self.step = step
+        self.window = deque()
+        self.pushed = 0
+        self.s = self.ss = None
+
+    def push(self, x):
+        """
+        Add the next date's vector. Returns the window's covariance when the window
+        is full and the date is one of every `step` sampled ones, else None.
+        """
+        x = np.asarray(x, dtype="float64")
+        if self.s is None:
+            self.s = np.zeros_like(x)
+            self.ss = np.zeros((len(x), len(x)))
+        self.window.append(x)
+        self.s += x
+        self.ss += np.outer(x, x)
+        if len(self.window) > self.rolling:
+            x_out = self.window.popleft()
+            self.s -= x_out
+            self.ss -= np.outer(x_out, x_out)
+
+        end = self.pushed
+        self.pushed += 1
+        if len(self.window) == self.rolling and (end - self.rolling + 1) % self.step == 0:
+            return (self.ss - np.outer(self.s, self.s) / self.rolling) / (self.rolling - 1)
+        return None
+
+
+def rolling_cov(X, rolling, step=1):
+    """
+    Rolling covariance over the rows of X (dates x symbols, no NaN).
+    Yields (row index, cov) for every sampled window.
+    """
+    roll = RollingCov(rolling, step)
+    for end, x in enumerate(X):
+        cov = roll.push(x)
+        if cov is not None:
+            yield end, cov
+
+
+async def complete_days(rows, symbols):
+    """
+    Group an async stream of (timestamp, symbol, r) rows ordered by timestamp into
+    one return vector per date, keeping only the dates on which every symbol has a
+    return. Yields (timestamp, vector) without materializing the rows.
+    """
+    index = {symbol: i for i, symbol in enumerate(symbols)}
+    current, vector, seen = None, None, 0
+    async for row in rows:
+        if row["timestamp"] != current:
+            if current is not None and seen == len(symbols):
+                yield current, vector
+            current, vector, seen = row["timestamp"], np.empty(len(symbols)), 0
+        vector[index[row["symbol"]]] = row["r"]
+        seen += 1
+    if current is not None and seen == len(symbols):
+        yield current, vector
+
+
+def corr_from_cov(cov):
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return cov / np.outer(std, std)
+
+
+def pack_upper(matrix):
+    """
+    Upper triangle (diagonal included, row-major) of a symmetric matrix as
+    base64-encoded little-endian float32.
+    """
+    upper = matrix[np.triu_indices(matrix.shape[0])]
+    return base64.b64encode(upper.astype("<f4").tobytes()).decode("ascii")
+
+
+def matrix_payload(symbols, cov, corr, fmt):
+    if fmt == "compact":
+        return {"covariance": pack_upper(cov), "correlation": pack_upper(corr)}
+
+    def as_dict(matrix):
+        return pd.DataFrame(matrix, index=symbols, columns=symbols).to_dict()
+
+    return {"covariance_matrix": as_dict(cov), "correlation_matrix": as_dict(corr)}
+
+
+def cov_corr(rows, window=None, rolling=None, step=1, fmt="json"):
+    """
+    Covariance and correlation matrices of the holdings over the dates on which all
+    of them have a return, optionally limited to the last `window` such dates.
+    With `rolling`, returns one pair of matrices per sampled date instead.
+    fmt="compact" swaps the nested dicts for a symbol index plus packed upper triangles.
+    """
+    returns = returns_matrix(rows).dropna()
+    if window:
+        returns = returns.iloc[-window:]
+
+    symbols = list(returns.columns)
+    X = returns.to_numpy()
+    result = {"symbols": symbols} if fmt == "compact" else {}
+
+    if rolling:
+        dates = [str(d)[:10] for d in returns.index]
+        result["series"] = [
+            {"date": dates[end], **matrix_payload(symbols, cov, corr_from_cov(cov), fmt)}
+            for end, cov in rolling_cov(X, rolling, step)
+        ]
+        return result
+
+    cov = np.cov(X, rowvar=False) if len(X) > 1 else np.full((len(symbols), len(symbols)), np.nan)
+    result.update(matrix_payload(symbols, cov, corr_from_cov(cov), fmt))
+    return result
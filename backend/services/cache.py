@@ -0,0 +1,112 @@
+import hashlib
+import json
+from datetime import date, timedelta
+from database.async_db import execute_query_async
+from redis_client import redis_client
+from services.ingest import MARKET_VERSION
+from services.l1cache import l1
+
+# Versioned keys are never invalidated in place, they just stop being read
+ANALYTICS_TTL = 7 * 24 * 3600
+HOT_PORTFOLIOS = 20
+
+
+async def data_versions(symbols):
+    """
+    Current data version of each symbol and of the market (0 if never written).
+    """
+    rows = await execute_query_async("""
+        SELECT symbol, version FROM symbol_versions WHERE symbol = ANY(%s)
+    """, (list(symbols) + [MARKET_VERSION],))
+    versions = {s: 0 for s in symbols}
+    versions[MARKET_VERSION] = 0
+    versions.update({r["symbol"]: r["version"] for r in rows})
+    return versions
+
+
+async def symbol_version(symbol):
+    """
+    data_versions for one symbol, kept in the worker's L1 until a write invalidates it.
+    """
+    key = f"version:{symbol}"
+    version = l1.get(key)
+    if version is None:
+        version = (await data_versions([symbol]))[symbol]
+        l1.set(key, version, len(key) + 8)
+    return version
+
+
+async def portfolio_symbols(portfolio_id):
+    """
+    Sorted symbols held by a portfolio, with the data versions of those symbols
+    and of the market.
+    """
+    rows = await execute_query_async("""
+        SELECT ph.stock_symbol AS symbol, COALESCE(v.version, 0) AS version
+        FROM portfolio_holdings ph
+        LEFT JOIN symbol_versions v ON v.symbol = ph.stock_symbol
+        WHERE ph.portfolio_id = %s
+        UNION ALL
+        SELECT %s, COALESCE((SELECT version FROM symbol_versions WHERE symbol = %s), 0)
+    """, (portfolio_id, MARKET_VERSION, MARKET_VERSION))
+    versions = {r["symbol"]: r["version"] for r in rows}
+    symbols = sorted(s for s in versions if s != MARKET_VERSION)
+    return symbols, versions
+
+
+def symbol_set_key(symbols, versions):
+    """
+    Canonical hash of a set of symbols and their data versions,
+    independent of order and duplicates.
+    """
+    canonical = ",".join(f"{s}@{versions.get(s, 0)}" for s in sorted(set(symbols)))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+async def get_per_symbol(prefix, symbols, versions, variant=""):
+    """
+    Fetch cached per-symbol results with one MGET. Returns (found, missing symbols).
+    """
+    if not symbols:
+        return {}, []
+    keys = [f"{prefix}:{s}:{versions[s]}{variant}" for s in symbols]
+    values = await redis_client.mget(keys)
+    found = {s: json.loads(v) for s, v in zip(symbols, values) if v is not None}
+    return found, [s for s in symbols if s not in found]
+
+
+async def set_per_symbol(prefix, results, versions, variant=""):
+    if not results:
+        return
+    pipe = redis_client.pipeline()
+    for symbol, value in results.items():
+        pipe.set(f"{prefix}:{symbol}:{versions[symbol]}{variant}", json.dumps(value), ex=ANALYTICS_TTL)
+    await pipe.execute()
+
+
+def _hot_key(day=None):
+    return f"analytics:hot:{(day or date.today()).isoformat()}"
+
+
+async def mark_hot(portfolio_id):
+    """
+    Count an analytics read for the portfolio in today's popularity ranking.
+    """
+    key = _hot_key()
+    await redis_client.zincrby(key, 1, portfolio_id)
+    await redis_client.expire(key, 2 * 24 * 3600)
+
+
+async def hot_portfolios(limit=HOT_PORTFOLIOS):
+    """
+    Most read portfolios over today and yesterday, so a refresh shortly after
+    midnight still sees the previous day's readers.
+    """
+    today = date.today()
+    recent = "analytics:hot:recent"
+    pipe = redis_client.pipeline()
+    pipe.zunionstore(recent, [_hot_key(today), _hot_key(today - timedelta(days=1))])
+    pipe.zrevrange(recent, 0, limit - 1)
+    pipe.delete(recent)
+    _, ids, _ = await pipe.execute()
+    return [int(i) for i in ids]
@@ -0,0 +1,67 @@
+import base64
+from datetime import date, datetime, timedelta
+import numpy as np
+from fastapi import HTTPException
+
+# Packed columnar price history, asked for with ?format=columns or this Accept type
+COLUMNS_MEDIA_TYPE = "application/vnd.stocks.columns+json"
+
+# Little-endian dtype of every packed value column. Volume stays float64 so it is
+# exact and can carry NaN for missing values.
+COLUMN_TYPES = {"open": "<f4", "high": "<f4", "low": "<f4", "close": "<f4", "volume": "<f8"}
+
+# SQL expression for timestamps as days since 1970-01-01, so dates leave the
+# database as plain integers
+EPOCH_DAYS_SQL = "(timestamp::date - DATE '1970-01-01') AS timestamp"
+
+EPOCH = date(1970, 1, 1)
+
+
+def wants_columns(request, format):
+    if format:
+        if format not in ("json", "columns"):
+            raise HTTPException(status_code=400, detail="format must be json or columns")
+        return format == "columns"
+    return COLUMNS_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def epoch_days(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+def pack(values, dtype):
+    array = np.asarray(values, dtype=dtype[1:]).astype(dtype)
+    return base64.b64encode(array.tobytes()).decode("ascii")
+
+
+def columnar_payload(symbol, columns):
+    """
+    Encode {column: values} (timestamps as epoch days, ascending) as one base64
+    buffer per column, prices as float32 and the symbol sent once. Dates are uint16
+    deltas from the previous row, the first one 0: row i's date is `start` plus the
+    running sum of deltas 0..i.
+    """
+    days = np.asarray(columns["timestamp"], dtype="int64")
+    payload = {
+        "symbol": symbol,
+        "count": len(days),
+        "start": str(EPOCH + timedelta(days=int(days[0]))) if len(days) else None,
+        "types": {"timestamp": "<u2", **{c: COLUMN_TYPES[c] for c in columns if c in COLUMN_TYPES}},
+        "timestamp": pack(np.diff(days, prepend=days[:1]), "<u2"),
+    }
+    for name, values in columns.items():
+        if name in COLUMN_TYPES:
+            payload[name] = pack(values, COLUMN_TYPES[name])
+    return payload
+
+
+def rows_to_columns(rows, names):
+    """
+    Transpose already-built rows (e.g. downsampled ones) into the columns
+    columnar_payload expects.
+    """
+    columns = {name: [r[name] for r in rows] for name in names if name != "symbol"}
+    columns["timestamp"] = [epoch_days(t) for t in columns["timestamp"]]
+    return columns
@@ -0,0 +1,142 @@
+from fastapi import HTTPException
+
+# Columns of the stocks table that may be requested through ?fields=
+STOCK_FIELDS = ["timestamp", "symbol", "open", "high", "low", "close", "volume"]
+
+# Chart intervals understood by ?interval=, relative to the latest stored day
+INTERVALS = {
+    "1W": "7 days",
+    "1M": "1 month",
+    "3M": "3 months",
+    "1Y": "1 year",
+    "5Y": "5 years",
+    "ALL": None,
+}
+
+
+def parse_fields(fields):
+    """
+    Turn a comma separated ?fields= value into a validated column list.
+    timestamp is always included since every chart needs an x-axis.
+    """
+    if not fields:
+        return list(STOCK_FIELDS)
+
+    requested = [f.strip().lower() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in STOCK_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    columns = ["timestamp"] + [f for f in STOCK_FIELDS if f in requested and f != "timestamp"]
+    return columns
+
+
+def range_clause(interval, start, end, anchor, anchor_params=(), column="timestamp"):
+    """
+    Build the WHERE fragment and params restricting stocks rows to a date range.
+    Explicit from/to win over interval. interval is anchored on `anchor`, an SQL
+    expression for the symbol's latest day that does not depend on the scanned row
+    (a parameterized latest_prices lookup or a joined latest_prices column), so the
+    range is an index bound rather than a per-row subquery.
+    """
+    clauses = []
+    params = []
+
+    if start:
+        clauses.append(f"{column} >= %s")
+        params.append(start)
+    if end:
+        clauses.append(f"{column} <= %s")
+        params.append(end)
+
+    if not start and interval:
+        key = interval.upper()
+        if key not in INTERVALS:
+            raise HTTPException(status_code=400, detail=f"Unknown interval '{interval}'")
+        if INTERVALS[key]:
+            clauses.append(f"{column} >= {anchor} - INTERVAL '{INTERVALS[key]}'")
+            params.extend(anchor_params)
+
+    return clauses, params
+
+
+def lttb(rows, threshold, key="close"):
+    """
+    Largest-Triangle-Three-Buckets downsampling of ordered rows on one value column.
+    Keeps the first and last row and the visually most significant row of every bucket.
+    """
+    n = len(rows)
+    if threshold >= n or threshold < 3:
+        return rows
+
+    sampled = [rows[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = (avg_start + avg_end - 1) / 2
+        avg_y = sum(float(rows[j][key]) for j in range(avg_start, avg_end)) / (avg_end - avg_start)
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax = a
+        ay = float(rows[a][key])
+
+        max_area = -1
+        next_a = range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (float(rows[j][key]) - ay) - (ax - j) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                next_a = j
+
+        sampled.append(rows[next_a])
+        a = next_a
+
+    sampled.append(rows[-1])
+    return sampled
+
+
+def ohlc_buckets(rows, threshold):
+    """
+    Aggregate ordered rows into at most threshold OHLCV bars.
+    Missing columns (because of ?fields=) are simply left out of the bars.
+    """
+    n = len(rows)
+    if threshold >= n or threshold < 1:
+        return rows
+
+    bars = []
+    size = n / threshold
+    for i in range(threshold):
+        bucket = rows[int(i * size):int((i + 1) * size)]
+        if not bucket:
+            continue
+
+        bar = dict(bucket[-1])
+        bar["timestamp"] = bucket[0]["timestamp"]
+        if "open" in bar:
+            bar["open"] = bucket[0]["open"]
+        if "high" in bar:
+            bar["high"] = max(r["high"] for r in bucket)
+        if "low" in bar:
+            bar["low"] = min(r["low"] for r in bucket)
+        if "volume" in bar:
+            bar["volume"] = sum(r["volume"] for r in bucket)
+        bars.append(bar)
+
+    return bars
+
+
+def downsample(rows, points, method="lttb"):
+    if not points:
+        return rows
+    if method == "lttb":
+        if rows and "close" not in rows[0]:
+            raise HTTPException(status_code=400, detail="lttb downsampling needs the close field")
+        return lttb(rows, points)
+    if method == "ohlc":
+        return ohlc_buckets(rows, points)
+    raise HTTPException(status_code=400, detail=f"Unknown downsampling method '{method}'")
@@ -0,0 +1,180 @@
+import json
+from datetime import date
+import pandas as pd
+from database.async_db import execute_query_async, execute_analytics_query_async
+
+SIGNED_SHARES = {"stock_buy": 1, "stock_sell": -1}
+
+
+def invalidate_snapshots(cursor):
+    """
+    Drop snapshots that priced a symbol left in stocks_staging on or after the
+    earliest staged day, inside the ingest transaction. New days only ever stage
+    dates after the last snapshot, so this is a no-op unless history was revised
+    or a symbol's day arrived after the snapshot was taken.
+    """
+    cursor.execute("""
+        DELETE FROM portfolio_snapshots ps
+        USING (
+            SELECT symbol, MIN(timestamp)::date AS since FROM stocks_staging GROUP BY symbol
+        ) c
+        WHERE ps.timestamp >= c.since
+        AND ps.portfolio_id IN (
+            SELECT portfolio_id FROM transaction WHERE stock_symbol = c.symbol
+        );
+    """)
+
+
+def as_of(series_or_frame, days):
+    """
+    Value of a step function, indexed by change date, on each of the given days.
+    """
+    index = series_or_frame.index.union(days)
+    return series_or_frame.reindex(index).ffill().loc[days]
+
+
+def replay(transactions, closes, days, cash=0.0, holdings=None):
+    """
+    End-of-day cash, holdings value and share counts on each day, starting from
+    `cash` and `holdings` ({symbol: shares}) and applying the given trades on top.
+    closes cover every held symbol, carry-in rows included so every day has a last price.
+    """
+    days = pd.DatetimeIndex(days)
+    seed = pd.Series(holdings or {}, dtype="float64")
+    tx = pd.DataFrame(transactions, columns=["day", "type", "amount", "stock_symbol", "shares"])
+
+    cash_by_day = pd.Series(float(cash), index=days)
+    changes = pd.DataFrame(index=days)
+    if not tx.empty:
+        tx["day"] = pd.to_datetime(tx["day"])
+        cash_by_day += as_of(tx.groupby("day")["amount"].sum().cumsum(), days).fillna(0.0)
+
+        trades = tx[tx["type"].isin(list(SIGNED_SHARES))]
+        if not trades.empty:
+            signed = trades["shares"].astype("float64") * trades["type"].map(SIGNED_SHARES)
+            changes = as_of(
+                trades.assign(signed=signed)
+                .pivot_table(index="day", columns="stock_symbol", values="signed", aggfunc="sum")
+                .fillna(0)
+                .cumsum(),
+                days,
+            ).fillna(0)
+
+    symbols = changes.columns.union(seed.index)
+    held = changes.reindex(columns=symbols, fill_value=0.0) + seed.reindex(symbols, fill_value=0.0)
+    if held.columns.empty:
+        return cash_by_day, pd.Series(0.0, index=days), held
+
+    prices = pd.DataFrame(closes, columns=["day", "symbol", "close"])
+    prices["day"] = pd.to_datetime(prices["day"])
+    prices = prices.pivot_table(index="day", columns="symbol", values="close", aggfunc="last")
+    prices = as_of(prices, days).reindex(columns=held.columns)
+
+    return cash_by_day, (held * prices).sum(axis=1), held
+
+
+async def extend_snapshots(portfolio_id):
+    """
+    Append snapshots for the completed trading days after the last stored one,
+    starting from that snapshot's cash and holdings and replaying only the trades
+    made after it. Today is left out since trades and prices can still land on it.
+    """
+    rows = await execute_query_async("""
+        SELECT s.timestamp AS last, s.cash, s.holdings,
+            (SELECT MIN(timestamp)::date FROM transaction WHERE portfolio_id = %s) AS first
+        FROM (SELECT 1) one
+        LEFT JOIN LATERAL (
+            SELECT timestamp, cash, holdings FROM portfolio_snapshots
+            WHERE portfolio_id = %s
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ) s ON true
+    """, (portfolio_id, portfolio_id))
+    state = rows[0]
+    if state["first"] is None:
+        return
+    last = state["last"]
+
+    days = await execute_query_async("""
+        SELECT timestamp FROM market_returns
+        WHERE timestamp >= %s AND timestamp < %s
+        AND (%s::date IS NULL OR timestamp > %s::date)
+        ORDER BY timestamp
+    """, (state["first"], date.today(), last, last))
+    days = [d["timestamp"] for d in days]
+    if not days:
+        return
+
+    transactions = await execute_query_async("""
+        SELECT timestamp::date AS day, type::text AS type, amount, stock_symbol, shares
+        FROM transaction
+        WHERE portfolio_id = %s AND (%s::date IS NULL OR timestamp >= %s::date + 1)
+        ORDER BY timestamp, transaction_id
+    """, (portfolio_id, last, last))
+
+    cash = state["cash"] if last else 0.0
+    holdings = (state["holdings"] or {}) if last else {}
+
+    symbols = sorted(set(holdings) | {t["stock_symbol"] for t in transactions if t["stock_symbol"]})
+    closes = []
+    if symbols:
+        # Last close before the first new day for each symbol, then every close after it
+        closes = await execute_analytics_query_async("""
+            SELECT c.timestamp::date AS day, sym AS symbol, c.close
+            FROM unnest(%s::varchar[]) AS sym
+            CROSS JOIN LATERAL (
+                SELECT timestamp, close FROM stocks
+                WHERE symbol = sym AND timestamp < %s
+                ORDER BY timestamp DESC
+                LIMIT 1
+            ) c
+            UNION ALL
+            SELECT timestamp::date, symbol, close FROM stocks
+            WHERE symbol = ANY(%s) AND timestamp >= %s AND timestamp <= %s
+        """, (symbols, days[0], symbols, days[0], days[-1]))
+        closes = [(r["day"], r["symbol"], r["close"]) for r in closes]
+
+    transactions = [
+        (t["day"], t["type"], t["amount"], t["stock_symbol"], t["shares"]) for t in transactions
+    ]
+    cash, value, held = replay(transactions, closes, days, cash, holdings)
+    positions = [
+        json.dumps({s: int(n) for s, n in row.items() if n})
+        for row in held.to_dict("records")
+    ] if not held.columns.empty else ["{}"] * len(days)
+
+    await execute_query_async("""
+        INSERT INTO portfolio_snapshots (portfolio_id, timestamp, cash, market_value, holdings)
+        SELECT %s, day, cash, market_value, holdings::jsonb
+        FROM unnest(%s::date[], %s::float8[], %s::float8[], %s::text[]) AS t(day, cash, market_value, holdings)
+        ON CONFLICT (portfolio_id, timestamp)
+        DO UPDATE SET cash = EXCLUDED.cash, market_value = EXCLUDED.market_value, holdings = EXCLUDED.holdings
+    """, (portfolio_id, days, [float(c) for c in cash], [float(v) for v in value], positions), fetch=False)
+
+
+async def equity_curve(portfolio_id, start=None, end=None):
+    """
+    Daily cash, holdings value and total value of a portfolio over [start, end].
+    Only the days missing from portfolio_snapshots are replayed.
+    """
+    await extend_snapshots(portfolio_id)
+
+    clauses = ["portfolio_id = %s"]
+    params = [portfolio_id]
+    if start:
+        clauses.append("timestamp >= %s")
+        params.append(start)
+    if end:
+        clauses.append("timestamp <= %s")
+        params.append(end)
+
+    rows = await execute_query_async(f"""
+        SELECT timestamp, cash, market_value, cash + market_value AS value
+        FROM portfolio_snapshots
+        WHERE {" AND ".join(clauses)}
+        ORDER BY timestamp
+    """, tuple(params))
+    return [
+        {"date": str(r["timestamp"]), "cash": r["cash"], "market_value": r["market_value"], "value": r["value"]}
+        for r in rows
+    ]
@@ -0,0 +1,161 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from datetime import date, timedelta
+import json
+import pandas as pd
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from fastapi import HTTPException
+from database.async_db import execute_analytics_query_async
+from redis_client import redis_client
+
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", str(os.cpu_count() or 2)))
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # Spawned, not forked: the server process already runs an event loop,
+        # threads and pool sockets that must not be copied into the workers
+        _executor = ProcessPoolExecutor(max_workers=FORECAST_WORKERS, mp_context=get_context("spawn"))
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+def fit_state(closes):
+    """
+    Fit Holt's linear trend model (Holt-Winters with additive trend, no seasonality)
+    on closes and return its smoothing parameters and final level/trend.
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+    model = ExponentialSmoothing(
+        pd.Series(closes, dtype="float64"),
+        trend="add",
+        seasonal=None,
+        initialization_method="estimated"
+    ).fit()
+    return {
+        "alpha": float(model.params["smoothing_level"]),
+        "beta": float(model.params["smoothing_trend"]),
+        "level": float(model.level.iloc[-1]),
+        "trend": float(model.trend.iloc[-1]),
+    }
+
+
+def update_state(state, closes):
+    """
+    Advance a fitted state over newly arrived closes with the stored parameters,
+    instead of refitting from scratch.
+    """
+    alpha, beta = state["alpha"], state["beta"]
+    level, trend = state["level"], state["trend"]
+    for y in closes:
+        prev_level = level
+        level = alpha * y + (1 - alpha) * (level + trend)
+        trend = beta * (level - prev_level) + (1 - beta) * trend
+    return {**state, "level": level, "trend": trend}
+
+
+def forecast_from_state(state, horizon):
+    return [state["level"] + (h + 1) * state["trend"] for h in range(horizon)]
+
+
+async def fit_state_async(closes):
+    """
+    Run fit_state on the process pool without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), fit_state, closes)
+
+
+async def get_model_state(symbol, version, timestamps, closes):
+    """
+    Return the fitted state for symbol's current data, reusing the one stored in Redis.
+    The stored state is tagged with the data version, row count and last timestamp
+    it was fitted on:
+    - same data version: reused as is
+    - only new rows appended since: advanced incrementally over those rows
+    - anything else (history rewritten, first call): refitted on the pool
+    """
+    key = f"hw:{symbol}"
+    n = len(closes)
+    last = str(timestamps[-1])[:10]
+
+    cached = await redis_client.get(key)
+    state = json.loads(cached) if cached else None
+
+    if state and state.get("version") == version and state["n"] == n:
+        return state
+
+    if state and state["n"] < n and str(timestamps[state["n"] - 1])[:10] == state["last_timestamp"]:
+        state = update_state(state, closes[state["n"]:])
+    else:
+        state = await fit_state_async(closes)
+
+    state.update(version=version, n=n, last_timestamp=last)
+    await redis_client.set(key, json.dumps(state))
+    return state
+
+
+async def load_model_state(symbol, version):
+    """
+    get_model_state for one symbol that only reads the price rows it needs:
+    none when the stored state matches the data version, the rows after its
+    last_timestamp when only new days were appended, and the full history
+    only for a first fit or a refit.
+    """
+    key = f"hw:{symbol}"
+    cached = await redis_client.get(key)
+    state = json.loads(cached) if cached else None
+
+    if state and state.get("version") == version:
+        return state
+
+    if state:
+        rows = await execute_analytics_query_async("""
+            SELECT timestamp, close,
+                (SELECT COUNT(*) FROM stocks WHERE symbol = %s AND timestamp <= %s) AS n_before
+            FROM stocks
+            WHERE symbol = %s AND timestamp > %s
+            ORDER BY timestamp ASC;
+        """, (symbol, state["last_timestamp"], symbol, state["last_timestamp"]))
+        # Appending is only safe when the rows the state was fitted on are all still there
+        if rows and rows[0]["n_before"] == state["n"]:
+            state = update_state(state, [float(r["close"]) for r in rows])
+            state.update(version=version, n=state["n"] + len(rows), last_timestamp=str(rows[-1]["timestamp"])[:10])
+            await redis_client.set(key, json.dumps(state))
+            return state
+
+    rows = await execute_analytics_query_async("""
+        SELECT timestamp, close
+        FROM stocks
+        WHERE symbol = %s
+        ORDER BY timestamp ASC;
+    """, (symbol,))
+    if len(rows) < 10:
+        raise HTTPException(status_code=400, detail="Not enough data to predict.")
+
+    state = await fit_state_async([float(r["close"]) for r in rows])
+    state.update(version=version, n=len(rows), last_timestamp=str(rows[-1]["timestamp"])[:10])
+    await redis_client.set(key, json.dumps(state))
+    return state
+
+
+def prediction_points(forecast, days):
+    """
+    Turn the first `days` forecast values into dated prediction points starting tomorrow.
+    """
+    last_date = pd.Timestamp(date.today())
+    return [
+        {"date": (last_date + timedelta(days=i+1)).strftime("%Y-%m-%d"), "predicted_close": forecast[i]}
+        for i in range(days)
+    ]
@@ -0,0 +1,171 @@
+import csv
+import io
+import os
+from fastapi import HTTPException
+from datetime import date, timedelta
+from database.db import execute_query, get_connection, release_connection
+from services.equity import invalidate_snapshots
+from services.prices import refresh_latest_prices
+from services.returns import refresh_returns
+
+# symbol_versions row tracking any change to market_returns
+MARKET_VERSION = "_market"
+
+STOCK_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume", "symbol"]
+
+# Overridable so the refresh engine can be pointed at a local stub of the quote API
+MARKET_DATA_URL = os.getenv("MARKET_DATA_URL", "https://www.alphavantage.co/query")
+
+
+OUTPUT_SIZES = ("auto", "compact", "full")
+
+# compact returns the latest 100 trading days, roughly 140 calendar days
+COMPACT_DAYS = 140
+
+
+def daily_series_url(symbol, outputsize="compact"):
+    api_key = os.getenv("AlphaVantageAPI_KEY")
+    return (
+        f'{MARKET_DATA_URL}?'
+        f'function=TIME_SERIES_DAILY&'
+        f'symbol={symbol}&'
+        f'outputsize={outputsize}&'
+        f'apikey={api_key}'
+    )
+
+
+def latest_timestamps(symbols):
+    """
+    Map each symbol to the timestamp of its newest stored row (missing if none).
+    """
+    rows = execute_query("""
+        SELECT symbol, MAX(timestamp) AS latest
+        FROM stocks
+        WHERE symbol = ANY(%s)
+        GROUP BY symbol
+    """, (list(symbols),))
+    return {r["symbol"]: r["latest"] for r in rows}
+
+
+def resolve_outputsize(outputsize, latest):
+    """
+    Pick compact when the 100 most recent days cover the gap since the latest stored
+    row, full when the symbol is new or too stale.
+    """
+    if outputsize not in OUTPUT_SIZES:
+        raise HTTPException(status_code=400, detail=f"outputsize must be one of {', '.join(OUTPUT_SIZES)}")
+    if outputsize != "auto":
+        return outputsize
+    if latest is None:
+        return "full"
+    if isinstance(latest, str):
+        latest = date.fromisoformat(latest[:10])
+    elif hasattr(latest, "date"):
+        latest = latest.date()
+    return "compact" if date.today() - latest < timedelta(days=COMPACT_DAYS) else "full"
+
+
+def parse_daily_series(symbol, data):
+    """
+    Convert an Alpha Vantage TIME_SERIES_DAILY payload into stocks rows.
+    """
+    if "Time Series (Daily)" not in data:
+        detail = data.get("Note") or data.get("Error Message") or data.get("Information") or "Unexpected response"
+        raise HTTPException(status_code=502, detail=f"Market data API error for '{symbol}': {detail}")
+
+    dailyData = data["Time Series (Daily)"]
+    return [
+        (
+            day,
+            values["1. open"],
+            values["2. high"],
+            values["3. low"],
+            values["4. close"],
+            values["5. volume"],
+            symbol,
+        )
+        for day, values in dailyData.items()
+    ]
+
+
+def bump_versions(cursor):
+    """
+    Bump the data version of every symbol left in stocks_staging, and of the market.
+    """
+    cursor.execute("""
+        INSERT INTO symbol_versions (symbol, version)
+        SELECT symbol, 1 FROM (SELECT DISTINCT symbol FROM stocks_staging) t
+        UNION ALL
+        SELECT %s, 1
+        ON CONFLICT (symbol)
+        DO UPDATE SET version = symbol_versions.version + 1;
+    """, (MARKET_VERSION,))
+
+
+def bulk_upsert_stocks(rows):
+    """
+    Load rows into stocks in one transaction: COPY into a temp table, drop staged rows
+    identical to what is stored, then merge the remaining delta with a single
+    INSERT ... ON CONFLICT. Unchanged rows are never touched, so a daily refresh
+    only writes the new days plus any revised ones. stock_returns, market_returns,
+    latest_prices and portfolio snapshots are kept in sync and the symbols' data
+    versions bumped in the same transaction.
+    Returns inserted / updated / unchanged counts.
+    """
+    if not rows:
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    conn = get_connection()
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TEMP TABLE stocks_staging (LIKE stocks INCLUDING DEFAULTS) ON COMMIT DROP;
+        """)
+        cursor.copy_expert(
+            f"COPY stocks_staging ({', '.join(STOCK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        cursor.execute("""
+            DELETE FROM stocks_staging st
+            USING stocks s
+            WHERE s.symbol = st.symbol
+            AND s.timestamp = st.timestamp
+            AND (s.open, s.high, s.low, s.close, s.volume)
+                IS NOT DISTINCT FROM (st.open, st.high, st.low, st.close, st.volume);
+        """)
+        cursor.execute("""
+            INSERT INTO stocks (timestamp, open, high, low, close, volume, symbol)
+            SELECT DISTINCT ON (timestamp, symbol) timestamp, open, high, low, close, volume, symbol
+            FROM stocks_staging
+            ORDER BY timestamp, symbol
+            ON CONFLICT (timestamp, symbol)
+            DO UPDATE SET
+                open = EXCLUDED.open, close = EXCLUDED.close, high = EXCLUDED.high, low = EXCLUDED.low, volume = EXCLUDED.volume
+            WHERE (stocks.open, stocks.high, stocks.low, stocks.close, stocks.volume)
+                IS DISTINCT FROM (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)
+            RETURNING (xmax = 0) AS inserted;
+        """)
+        written = cursor.fetchall()
+        if written:
+            refresh_returns(cursor)
+            refresh_latest_prices(cursor)
+            invalidate_snapshots(cursor)
+            bump_versions(cursor)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Database insert error: {str(e)}")
+    finally:
+        if cursor is not None:
+            cursor.close()
+        release_connection(conn)
+
+    inserted = sum(1 for r in written if r["inserted"])
+    updated = len(written) - inserted
+    distinct = len({(r[0], r[6]) for r in rows})
+    return {"inserted": inserted, "updated": updated, "unchanged": distinct - inserted - updated}
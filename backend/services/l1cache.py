@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from redis_client import redis_client
+
+L1_MAX_BYTES = int(os.getenv("L1_MAX_BYTES", str(64 * 1024 * 1024)))
+L1_TTL = float(os.getenv("L1_TTL", "60"))
+INVALIDATION_CHANNEL = "l1:invalidate"
+L1_RECONNECT_DELAY = float(os.getenv("L1_RECONNECT_DELAY", "1"))
+
+
+class L1Cache:
+    """
+    Per-worker LRU cache of already-parsed values with a TTL and a total byte bound.
+    Sizes are the length of the JSON payload the value was decoded from.
+    Safe to use from sync handlers running in the threadpool.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, ttl=L1_TTL):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (value, size, time.monotonic() + ttl)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+
+    def delete_prefix(self, prefix):
+        with self.lock:
+            for key in [k for k in self.entries if k.startswith(prefix)]:
+                self._drop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _drop(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+
+l1 = L1Cache(L1_MAX_BYTES)
+
+
+async def cached_get(key, ttl=L1_TTL):
+    """
+    Read a JSON value from L1, falling back to Redis and keeping the parsed result.
+    """
+    value = l1.get(key)
+    if value is not None:
+        return value
+    raw = await redis_client.get(key)
+    if raw is None:
+        return None
+    value = json.loads(raw)
+    l1.set(key, value, len(raw), ttl)
+    return value
+
+
+async def cached_set(key, value, ex=None, ttl=L1_TTL):
+    raw = json.dumps(value)
+    await redis_client.set(key, raw, ex=ex)
+    l1.set(key, value, len(raw), ttl)
+
+
+async def invalidate(*prefixes):
+    """
+    Drop keys starting with any of the prefixes from this worker's L1 and tell
+    every other worker to do the same.
+    """
+    for prefix in prefixes:
+        l1.delete_prefix(prefix)
+    await redis_client.publish(INVALIDATION_CHANNEL, json.dumps(prefixes))
+
+
+async def _consume_invalidations():
+    pubsub = redis_client.pubsub()
+    try:
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        async for message in pubsub.listen():
+            if message["type"] != "message":
+                continue
+            for prefix in json.loads(message["data"]):
+                l1.delete_prefix(prefix)
+    finally:
+        await pubsub.aclose()
+
+
+async def listen_invalidations():
+    """
+    Apply other workers' invalidations to this worker's L1, resubscribing when the
+    Redis connection drops. Invalidations published while disconnected are lost,
+    so L1 is emptied before every resubscribe instead of serving stale entries.
+    """
+    while True:
+        try:
+            await _consume_invalidations()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("L1 invalidation listener lost Redis, reconnecting:", e)
+        l1.clear()
+        await asyncio.sleep(L1_RECONNECT_DELAY)
@@ -0,0 +1,37 @@
+from database.async_db import execute_query_async
+
+LATEST_PRICES_SQL = """
+    SELECT symbol, close, timestamp FROM latest_prices WHERE symbol = ANY(%s)
+"""
+
+
+def refresh_latest_prices(cursor):
+    """
+    Move latest_prices forward for the rows left in stocks_staging, inside the
+    ingest transaction. Staged rows older than the stored latest leave it alone.
+    """
+    cursor.execute("""
+        INSERT INTO latest_prices (symbol, timestamp, close)
+        SELECT DISTINCT ON (symbol) symbol, timestamp, close
+        FROM stocks_staging
+        ORDER BY symbol, timestamp DESC
+        ON CONFLICT (symbol)
+        DO UPDATE SET timestamp = EXCLUDED.timestamp, close = EXCLUDED.close
+        WHERE EXCLUDED.timestamp >= latest_prices.timestamp;
+    """)
+
+
+async def get_latest_prices(symbols, conn=None):
+    """
+    Newest close of each symbol as {symbol: close}, one primary-key lookup per symbol.
+    Symbols without any price are left out. Pass conn to read inside a transaction.
+    """
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    if conn is None:
+        rows = await execute_query_async(LATEST_PRICES_SQL, (symbols,))
+    else:
+        cursor = await conn.execute(LATEST_PRICES_SQL, (symbols,))
+        rows = await cursor.fetchall()
+    return {r["symbol"]: r["close"] for r in rows}
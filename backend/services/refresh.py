@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+import httpx
+from fastapi import HTTPException
+from database.db import execute_query
+from services.l1cache import invalidate
+from redis_client import redis_client
+from services.ingest import daily_series_url, latest_timestamps, resolve_outputsize, parse_daily_series, bulk_upsert_stocks
+
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", "5"))
+REFRESH_RATE_PER_MINUTE = int(os.getenv("REFRESH_RATE_PER_MINUTE", "75"))
+REFRESH_TIMEOUT = float(os.getenv("REFRESH_TIMEOUT", "30"))
+# "HH:MM" local time for the nightly full refresh, unset to disable
+REFRESH_DAILY_AT = os.getenv("REFRESH_DAILY_AT")
+
+# Finished job statuses stay readable for this long
+REFRESH_JOB_TTL = 24 * 3600
+
+# Jobs running on this worker; their status is mirrored to a Redis hash per job
+# so any worker can answer GET /stocks/refresh/{job_id}
+jobs = {}
+_tasks = {}
+
+JOB_FIELDS = ("job_id", "state", "started_at", "finished_at", "total", "done", "failed")
+
+
+def _job_key(job_id):
+    return f"refresh:job:{job_id}"
+
+
+async def _save_job(job, *symbols):
+    """
+    Write the job's top-level fields and the status of the given symbols.
+    """
+    fields = {k: json.dumps(job[k]) for k in JOB_FIELDS}
+    for symbol in symbols:
+        fields[f"symbol:{symbol}"] = json.dumps(job["symbols"][symbol])
+    key = _job_key(job["job_id"])
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping=fields)
+    pipe.expire(key, REFRESH_JOB_TTL)
+    await pipe.execute()
+
+
+async def get_job(job_id):
+    raw = await redis_client.hgetall(_job_key(job_id))
+    if not raw:
+        return None
+    job = {"symbols": {}}
+    for field, value in raw.items():
+        if field.startswith("symbol:"):
+            job["symbols"][field[len("symbol:"):]] = json.loads(value)
+        else:
+            job[field] = json.loads(value)
+    return job
+
+
+class RateLimiter:
+    """
+    Spaces out request starts so no more than `per_minute` go out in any minute.
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0
+        self.next_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def all_symbols():
+    rows = execute_query("SELECT symbol FROM stocks GROUP BY symbol ORDER BY symbol")
+    return [r["symbol"] for r in rows]
+
+
+async def _refresh_symbol(client, limiter, semaphore, job, symbol, outputsize):
+    status = job["symbols"][symbol]
+    status["outputsize"] = outputsize
+    async with semaphore:
+        await limiter.wait()
+        status["state"] = "fetching"
+        try:
+            await _save_job(job, symbol)
+            r = await client.get(daily_series_url(symbol, outputsize))
+            r.raise_for_status()
+            rows = parse_daily_series(symbol, r.json())
+
+            status["state"] = "loading"
+            await _save_job(job, symbol)
+            counts = await asyncio.to_thread(bulk_upsert_stocks, rows)
+            if counts["inserted"] or counts["updated"]:
+                await invalidate("stocks:symbols", f"version:{symbol}")
+
+            status.update(state="done", **counts)
+            job["done"] += 1
+        except HTTPException as e:
+            status.update(state="failed", error=e.detail)
+            job["failed"] += 1
+        except Exception as e:
+            status.update(state="failed", error=str(e))
+            job["failed"] += 1
+        await _save_job(job, symbol)
+
+
+async def run_refresh(job_id, symbols, rate_per_minute, concurrency, outputsizes, on_done=None):
+    job = jobs[job_id]
+    job["state"] = "running"
+    await _save_job(job)
+    limiter = RateLimiter(rate_per_minute)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=REFRESH_TIMEOUT) as client:
+        await asyncio.gather(*[
+            _refresh_symbol(client, limiter, semaphore, job, symbol, outputsizes[symbol])
+            for symbol in symbols
+        ])
+
+    job["state"] = "finished"
+    job["finished_at"] = datetime.now().isoformat()
+    await _save_job(job)
+    jobs.pop(job_id, None)
+    _tasks.pop(job_id, None)
+
+    if on_done and job["done"]:
+        try:
+            await on_done()
+        except Exception as e:
+            print("Refresh follow-up failed:", e)
+
+
+async def start_refresh(symbols, rate_per_minute=None, concurrency=None, outputsize="auto", latest=None, on_done=None):
+    """
+    Schedule a background refresh of the given symbols on the running event loop
+    and return the new job's status dict, already readable through get_job. latest maps symbols to their newest stored
+    timestamp and drives the compact/full choice when outputsize is "auto".
+    on_done is awaited once the job finishes with at least one symbol loaded.
+    """
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    latest = latest or {}
+    outputsizes = {s: resolve_outputsize(outputsize, latest.get(s)) for s in symbols}
+
+    job_id = uuid.uuid4().hex
+    jobs[job_id] = {
+        "job_id": job_id,
+        "state": "queued",
+        "started_at": datetime.now().isoformat(),
+        "finished_at": None,
+        "total": len(symbols),
+        "done": 0,
+        "failed": 0,
+        "symbols": {s: {"state": "queued"} for s in symbols},
+    }
+    await _save_job(jobs[job_id], *symbols)
+    _tasks[job_id] = asyncio.create_task(run_refresh(
+        job_id,
+        symbols,
+        rate_per_minute or REFRESH_RATE_PER_MINUTE,
+        concurrency or REFRESH_CONCURRENCY,
+        outputsizes,
+        on_done,
+    ))
+    return jobs[job_id]
+
+
+async def nightly_refresh_loop(on_done=None):
+    """
+    Refresh every stored symbol once a day at REFRESH_DAILY_AT.
+    on_done is passed on to every nightly job (see start_refresh).
+    Every worker runs this loop; a per-date Redis lock lets only one of them
+    start each night's job.
+    """
+    hour, minute = (int(x) for x in REFRESH_DAILY_AT.split(":"))
+    while True:
+        now = datetime.now()
+        run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        await asyncio.sleep((run_at - now).total_seconds())
+
+        try:
+            claimed = await redis_client.set(
+                f"refresh:nightly:{run_at.date().isoformat()}", uuid.uuid4().hex, nx=True, ex=REFRESH_JOB_TTL
+            )
+            if not claimed:
+                continue
+            symbols = await asyncio.to_thread(all_symbols)
+            latest = await asyncio.to_thread(latest_timestamps, symbols)
+            job = await start_refresh(symbols, latest=latest, on_done=on_done)
+            task = _tasks.get(job["job_id"])
+            if task:
+                await task
+        except Exception as e:
+            print("Nightly refresh failed:", e)
@@ -0,0 +1,58 @@
+# pg_advisory_xact_lock key guarding market_returns recomputation
+MARKET_RETURNS_LOCK = 720_145_001
+
+
+def refresh_returns(cursor):
+    """
+    Recompute stock_returns and market_returns for the rows left in stocks_staging,
+    inside the ingest transaction. A changed close moves the return on its own day and
+    on the symbol's next stored day, so both are refreshed.
+    """
+    cursor.execute("""
+        CREATE TEMP TABLE returns_affected ON COMMIT DROP AS
+        WITH changed AS (
+            SELECT DISTINCT symbol, timestamp FROM stocks_staging
+        )
+        SELECT symbol, timestamp FROM changed
+        UNION
+        SELECT c.symbol, nxt.timestamp
+        FROM changed c
+        CROSS JOIN LATERAL (
+            SELECT s.timestamp FROM stocks s
+            WHERE s.symbol = c.symbol AND s.timestamp > c.timestamp
+            ORDER BY s.timestamp ASC
+            LIMIT 1
+        ) nxt;
+    """)
+
+    cursor.execute("""
+        INSERT INTO stock_returns (symbol, timestamp, r, log_r)
+        SELECT s.symbol, s.timestamp, s.close / prev.close - 1,
+            CASE WHEN s.close > 0 AND prev.close > 0 THEN LN(s.close / prev.close) END
+        FROM returns_affected a
+        JOIN stocks s ON s.symbol = a.symbol AND s.timestamp = a.timestamp
+        CROSS JOIN LATERAL (
+            SELECT NULLIF(p.close, 0) AS close FROM stocks p
+            WHERE p.symbol = s.symbol AND p.timestamp < s.timestamp
+            ORDER BY p.timestamp DESC
+            LIMIT 1
+        ) prev
+        WHERE prev.close IS NOT NULL
+        ON CONFLICT (symbol, timestamp)
+        DO UPDATE SET r = EXCLUDED.r, log_r = EXCLUDED.log_r;
+    """)
+
+    # Serialize the market step across concurrent ingests. The lock is only granted
+    # once earlier holders committed, so the next statement's snapshot sees all of
+    # their stock_returns rows and AVG covers every symbol of the day.
+    cursor.execute("SELECT pg_advisory_xact_lock(%s);", (MARKET_RETURNS_LOCK,))
+    cursor.execute("""
+        INSERT INTO market_returns (timestamp, market_r, n_symbols)
+        SELECT timestamp, AVG(r), COUNT(*)
+        FROM stock_returns
+        WHERE timestamp IN (SELECT timestamp FROM returns_affected)
+        GROUP BY timestamp
+        ORDER BY timestamp
+        ON CONFLICT (timestamp)
+        DO UPDATE SET market_r = EXCLUDED.market_r, n_symbols = EXCLUDED.n_symbols;
+    """)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from fastapi import HTTPException
+from redis_client import redis_client
+
+SINGLE_FLIGHT_LOCK_TTL = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL", "60"))
+SINGLE_FLIGHT_WAIT = float(os.getenv("SINGLE_FLIGHT_WAIT", "30"))
+
+# Only delete the lock if we still own it (it may have expired and been retaken)
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+_background = set()
+
+
+async def _run_and_publish(key, token, compute):
+    try:
+        value = await compute()
+        await redis_client.publish(f"sf:{key}", json.dumps({"value": value}))
+        return value
+    except Exception as e:
+        # Waiters re-raise the same error instead of all retrying the failing compute
+        status = e.status_code if isinstance(e, HTTPException) else 500
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        await redis_client.publish(f"sf:{key}", json.dumps({"error": {"status": status, "detail": detail}}))
+        raise
+    finally:
+        await redis_client.eval(_RELEASE_LOCK, 1, f"lock:{key}", token)
+
+
+async def _revalidate(key, token, compute):
+    try:
+        await _run_and_publish(key, token, compute)
+    except Exception as e:
+        print(f"Background recompute of {key} failed:", e)
+
+
+async def single_flight(key, compute, get_cached, stale=None):
+    """
+    Make sure only one worker computes `key` at a time across all processes.
+
+    compute: coroutine function that computes the value, writes it to the cache
+        and returns it (JSON-serializable).
+    get_cached: coroutine function returning the cached value or None; used by
+        waiters in case the value landed before they subscribed.
+    stale: a previous value. When given it is returned right away while the value
+        is recomputed in the background (stale-while-revalidate), instead of waiting.
+
+    The winner takes a Redis lock and publishes the result on sf:{key}; everybody
+    else subscribes and waits for that message, falling back to computing the value
+    themselves if nothing arrives within SINGLE_FLIGHT_WAIT seconds. If the winner
+    fails, its status and detail are published and re-raised by every waiter.
+    """
+    token = uuid.uuid4().hex
+    if await redis_client.set(f"lock:{key}", token, nx=True, ex=SINGLE_FLIGHT_LOCK_TTL):
+        if stale is not None:
+            task = asyncio.create_task(_revalidate(key, token, compute))
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+            return stale
+        return await _run_and_publish(key, token, compute)
+
+    if stale is not None:
+        return stale
+
+    pubsub = redis_client.pubsub()
+    await pubsub.subscribe(f"sf:{key}")
+    try:
+        cached = await get_cached()
+        if cached is not None:
+            return cached
+
+        deadline = time.monotonic() + SINGLE_FLIGHT_WAIT
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is None:
+                continue
+            payload = json.loads(message["data"])
+            if "value" in payload:
+                return payload["value"]
+            error = payload["error"]
+            raise HTTPException(status_code=error["status"], detail=error["detail"])
+    finally:
+        await pubsub.unsubscribe(f"sf:{key}")
+        await pubsub.aclose()
+
+    return await compute()
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def stream_format(request, stream, allowed=tuple(STREAM_FORMATS)):
+    """
+    Streaming format asked for through ?stream= or, failing that, the Accept header
+    (no request when a handler is called directly). None means a regular JSON response.
+    """
+    if stream:
+        if stream not in allowed:
+            raise HTTPException(status_code=400, detail=f"stream must be one of {', '.join(allowed)}")
+        return stream
+    accept = request.headers.get("accept", "") if request is not None else ""
+    for fmt in allowed:
+        if STREAM_FORMATS[fmt] in accept:
+            return fmt
+    return None
+
+
+def _default(value):
+    # Same encoding FastAPI uses for dates and Decimals in regular responses
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return float(value)
+
+
+def ndjson_line(value):
+    return json.dumps(value, default=_default) + "\n"
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield ndjson_line(row)
+
+
+def csv_lines(rows):
+    """
+    CSV text with a header taken from the first row's keys, one chunk per row.
+    """
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow({k: (_default(v) if hasattr(v, "isoformat") else v) for k, v in row.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def peek(rows):
+    """
+    First row of an iterator plus an iterator that still yields it, so a handler
+    can answer 404 before any byte of the stream is sent.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+
+    def chained():
+        yield first
+        yield from rows
+
+    return first, chained()
+
+
+def stream_rows(rows, fmt):
+    lines = ndjson_lines(rows) if fmt == "ndjson" else csv_lines(rows)
+    return StreamingResponse(lines, media_type=STREAM_FORMATS[fmt])
@@ -0,0 +1,295 @@
+from fastapi import HTTPException
+from database.async_db import execute_query_async, async_transaction
+from services.prices import get_latest_prices
+
+# One statement per transaction type. Each checks its precondition in the WHERE of
+# the row-locking UPDATE/DELETE, so the check and the write are atomic, and returns
+# no row when the precondition fails.
+TRADE_SQL = {
+    "cash_deposit": """
+        WITH p AS (
+            UPDATE portfolio SET cash = cash + %(cash)s
+            WHERE portfolio_id = %(portfolio_id)s
+            RETURNING cash
+        ),
+        t AS (
+            INSERT INTO transaction (amount, type, timestamp, portfolio_id, username)
+            SELECT %(cash)s, 'cash_deposit', %(today)s, %(portfolio_id)s, %(username)s FROM p
+        )
+        SELECT cash, NULL::real AS price, NULL::int AS shares FROM p;
+    """,
+    "cash_withdraw": """
+        WITH p AS (
+            UPDATE portfolio SET cash = cash - %(cash)s
+            WHERE portfolio_id = %(portfolio_id)s AND cash >= %(cash)s
+            RETURNING cash
+        ),
+        t AS (
+            INSERT INTO transaction (amount, type, timestamp, portfolio_id, username)
+            SELECT -%(cash)s, 'cash_withdraw', %(today)s, %(portfolio_id)s, %(username)s FROM p
+        )
+        SELECT cash, NULL::real AS price, NULL::int AS shares FROM p;
+    """,
+    "stock_buy": """
+        WITH price AS (
+            SELECT close FROM latest_prices WHERE symbol = %(symbol)s
+        ),
+        p AS (
+            UPDATE portfolio SET cash = cash - %(shares)s * price.close
+            FROM price
+            WHERE portfolio_id = %(portfolio_id)s AND cash >= %(shares)s * price.close
+            RETURNING portfolio.cash, price.close AS price
+        ),
+        h AS (
+            INSERT INTO portfolio_holdings (portfolio_id, stock_symbol, shares)
+            SELECT %(portfolio_id)s, %(symbol)s, %(shares)s FROM p
+            ON CONFLICT (portfolio_id, stock_symbol)
+            DO UPDATE SET
+                shares = portfolio_holdings.shares + EXCLUDED.shares
+            RETURNING shares
+        ),
+        t AS (
+            INSERT INTO transaction (amount, type, timestamp, portfolio_id, username, stock_symbol, shares)
+            SELECT -(%(shares)s * p.price), 'stock_buy', %(today)s, %(portfolio_id)s, %(username)s, %(symbol)s, %(shares)s
+            FROM p
+        )
+        SELECT p.cash, p.price, h.shares FROM p, h;
+    """,
+    # The portfolio row is locked first (same order as run_orders), then the holding.
+    # Update or delete is chosen from the locked, current share count rather than the
+    # statement snapshot, so concurrent sells of the same holding queue up correctly.
+    "stock_sell": """
+        WITH price AS (
+            SELECT close FROM latest_prices WHERE symbol = %(symbol)s
+        ),
+        owner AS (
+            SELECT portfolio_id FROM portfolio WHERE portfolio_id = %(portfolio_id)s FOR UPDATE
+        ),
+        held AS (
+            SELECT ph.shares
+            FROM portfolio_holdings ph
+            JOIN owner o ON o.portfolio_id = ph.portfolio_id
+            WHERE ph.portfolio_id = %(portfolio_id)s AND ph.stock_symbol = %(symbol)s
+            AND EXISTS (SELECT 1 FROM price)
+            FOR UPDATE OF ph
+        ),
+        updated AS (
+            UPDATE portfolio_holdings ph SET shares = held.shares - %(shares)s
+            FROM held
+            WHERE ph.portfolio_id = %(portfolio_id)s AND ph.stock_symbol = %(symbol)s
+            AND held.shares > %(shares)s
+            RETURNING ph.shares
+        ),
+        deleted AS (
+            DELETE FROM portfolio_holdings ph
+            USING held
+            WHERE ph.portfolio_id = %(portfolio_id)s AND ph.stock_symbol = %(symbol)s
+            AND held.shares = %(shares)s
+            RETURNING 0 AS shares
+        ),
+        h AS (
+            SELECT shares FROM updated UNION ALL SELECT shares FROM deleted
+        ),
+        p AS (
+            UPDATE portfolio SET cash = cash + %(shares)s * price.close
+            FROM price
+            WHERE portfolio_id = %(portfolio_id)s AND EXISTS (SELECT 1 FROM h)
+            RETURNING portfolio.cash, price.close AS price
+        ),
+        t AS (
+            INSERT INTO transaction (amount, type, timestamp, portfolio_id, username, stock_symbol, shares)
+            SELECT %(shares)s * p.price, 'stock_sell', %(today)s, %(portfolio_id)s, %(username)s, %(symbol)s, %(shares)s
+            FROM p
+        )
+        SELECT p.cash, p.price, h.shares FROM p, h;
+    """,
+}
+
+
+def trade_params(portfolio_id, cash, symbol, shares, username, today):
+    return {
+        "portfolio_id": portfolio_id,
+        "cash": cash,
+        "symbol": symbol,
+        "shares": shares,
+        "username": username,
+        "today": today,
+    }
+
+
+async def explain_rejection(portfolio_id, type, cash, symbol, shares):
+    """
+    Work out why a trade statement matched no row, with the same errors the
+    step-by-step checks used to raise. Only runs on the failure path.
+    """
+    rows = await execute_query_async("""
+        SELECT
+            p.cash,
+            (SELECT close FROM latest_prices WHERE symbol = %(symbol)s) AS price,
+            (SELECT shares FROM portfolio_holdings WHERE portfolio_id = %(portfolio_id)s AND stock_symbol = %(symbol)s) AS shares
+        FROM portfolio p
+        WHERE p.portfolio_id = %(portfolio_id)s;
+    """, {"portfolio_id": portfolio_id, "symbol": symbol})
+
+    if not rows:
+        return HTTPException(status_code=404, detail="Portfolio not found")
+    current = rows[0]
+
+    if type in ("stock_buy", "stock_sell") and current["price"] is None:
+        return HTTPException(status_code=404, detail=f"No price found for {symbol}")
+    if type == "stock_sell":
+        if current["shares"] is None:
+            return HTTPException(
+                status_code=400,
+                detail=f"You don't own any shares of {symbol} to sell."
+            )
+        return HTTPException(
+            status_code=400,
+            detail=f"Not enough shares to sell: you own {current['shares']}, tried to sell {shares}."
+        )
+    return HTTPException(
+        status_code=400,
+        detail=f"Insufficient funds: current balance is {current['cash']}"
+    )
+
+
+async def run_trade(portfolio_id, type, cash, symbol, shares, username, today):
+    """
+    Apply one deposit / withdraw / buy / sell as a single atomic statement.
+    Returns the new cash balance, the execution price and the resulting holding.
+    """
+    if type not in TRADE_SQL:
+        raise HTTPException(status_code=400, detail=f"Unknown transaction type '{type}'")
+    if type in ("stock_buy", "stock_sell"):
+        if not symbol or shares is None or shares <= 0:
+            raise HTTPException(status_code=400, detail="stock_symbol and a positive number of shares are required.")
+    elif cash is None or cash <= 0:
+        raise HTTPException(status_code=400, detail="cash must be positive.")
+
+    rows = await execute_query_async(
+        TRADE_SQL[type],
+        trade_params(portfolio_id, cash, symbol, shares, username, today)
+    )
+    if not rows:
+        raise await explain_rejection(portfolio_id, type, cash, symbol, shares)
+    return rows[0]
+
+
+def plan_orders(orders, cash, holdings, prices):
+    """
+    Walk the legs in the order given against the locked cash and holdings.
+    Raises on the first leg that cannot be filled, otherwise returns the filled
+    legs with the resulting cash and holdings.
+    """
+    cash = float(cash)
+    holdings = dict(holdings)
+    filled = []
+
+    for i, order in enumerate(orders):
+        def reject(status, detail):
+            return HTTPException(status_code=status, detail=f"Order {i} ({order.type}): {detail}")
+
+        if order.type in ("stock_buy", "stock_sell"):
+            if not order.stock_symbol or order.shares <= 0:
+                raise reject(400, "stock_symbol and a positive number of shares are required.")
+            price = prices.get(order.stock_symbol)
+            if price is None:
+                raise reject(404, f"No price found for {order.stock_symbol}")
+            amount = order.shares * price
+            owned = holdings.get(order.stock_symbol, 0)
+
+            if order.type == "stock_buy":
+                if cash < amount:
+                    raise reject(400, f"Insufficient funds: balance at this point is {cash}")
+                cash -= amount
+                holdings[order.stock_symbol] = owned + order.shares
+                amount = -amount
+            else:
+                if owned == 0:
+                    raise reject(400, f"You don't own any shares of {order.stock_symbol} to sell.")
+                if owned < order.shares:
+                    raise reject(400, f"Not enough shares to sell: you own {owned}, tried to sell {order.shares}.")
+                cash += amount
+                holdings[order.stock_symbol] = owned - order.shares
+            filled.append({"type": order.type, "stock_symbol": order.stock_symbol,
+                           "shares": order.shares, "price": price, "amount": amount})
+
+        elif order.type in ("cash_deposit", "cash_withdraw"):
+            if order.cash <= 0:
+                raise reject(400, "cash must be positive.")
+            if order.type == "cash_withdraw":
+                if cash < order.cash:
+                    raise reject(400, f"Insufficient funds: balance at this point is {cash}")
+                cash -= order.cash
+                amount = -order.cash
+            else:
+                cash += order.cash
+                amount = order.cash
+            filled.append({"type": order.type, "stock_symbol": None,
+                           "shares": None, "price": None, "amount": amount})
+
+        else:
+            raise reject(400, "Unknown transaction type")
+
+    return filled, cash, holdings
+
+
+async def run_orders(portfolio_id, orders, username, today):
+    """
+    Fill a list of deposit / withdraw / buy / sell legs all-or-nothing in one
+    transaction. Every leg is validated before anything is written, and the writes
+    are one statement per table however many legs there are.
+    """
+    symbols = {o.stock_symbol for o in orders if o.type in ("stock_buy", "stock_sell") and o.stock_symbol}
+
+    async with async_transaction() as conn:
+        # Lock the portfolio first, then its holdings, like the single-leg statements
+        cursor = await conn.execute(
+            "SELECT cash FROM portfolio WHERE portfolio_id = %s FOR UPDATE", (portfolio_id,)
+        )
+        portfolio = await cursor.fetchone()
+        if portfolio is None:
+            raise HTTPException(status_code=404, detail="Portfolio not found")
+
+        cursor = await conn.execute("""
+            SELECT stock_symbol, shares FROM portfolio_holdings
+            WHERE portfolio_id = %s FOR UPDATE
+        """, (portfolio_id,))
+        holdings = {r["stock_symbol"]: r["shares"] for r in await cursor.fetchall()}
+
+        prices = await get_latest_prices(symbols, conn)
+        filled, cash, after = plan_orders(orders, portfolio["cash"], holdings, prices)
+
+        cursor = await conn.execute("""
+            UPDATE portfolio SET cash = cash + %s WHERE portfolio_id = %s RETURNING cash
+        """, (cash - float(portfolio["cash"]), portfolio_id))
+        cash = (await cursor.fetchone())["cash"]
+
+        changed = {s: n for s, n in after.items() if holdings.get(s, 0) != n}
+        kept = {s: n for s, n in changed.items() if n > 0}
+        if kept:
+            await conn.execute("""
+                INSERT INTO portfolio_holdings (portfolio_id, stock_symbol, shares)
+                SELECT %s, symbol, shares FROM unnest(%s::varchar[], %s::int[]) AS t(symbol, shares)
+                ON CONFLICT (portfolio_id, stock_symbol)
+                DO UPDATE SET shares = EXCLUDED.shares
+            """, (portfolio_id, list(kept), list(kept.values())))
+        emptied = [s for s, n in changed.items() if n == 0]
+        if emptied:
+            await conn.execute("""
+                DELETE FROM portfolio_holdings WHERE portfolio_id = %s AND stock_symbol = ANY(%s)
+            """, (portfolio_id, emptied))
+
+        await conn.execute("""
+            INSERT INTO transaction (amount, type, timestamp, portfolio_id, username, stock_symbol, shares)
+            SELECT amount, type::transaction_type, %s, %s, %s, symbol, shares
+            FROM unnest(%s::real[], %s::text[], %s::varchar[], %s::int[]) AS t(amount, type, symbol, shares)
+        """, (
+            today, portfolio_id, username,
+            [f["amount"] for f in filled],
+            [f["type"] for f in filled],
+            [f["stock_symbol"] for f in filled],
+            [f["shares"] for f in filled],
+        ))
+
+    return {"cash": cash, "holdings": changed, "orders": filled}
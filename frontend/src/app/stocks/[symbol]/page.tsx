@@ -17,14 +17,12 @@ import {
 
 interface StockData {
   timestamp: string;
-  symbol: string;
-  open: number;
-  high: number;
-  low: number;
   close: number;
-  volume: number;
 }
 
+// Max number of points requested for the history chart
+const CHART_POINTS = 500;
+
 const INTERVALS = [
   { label: "1W", days: 7 },
   { label: "1M", days: 30 },
@@ -46,7 +44,6 @@ export default function StockDetailPage() {
   const params = useParams();
   const symbol = params.symbol as string;
 
-  const [data, setData] = useState<StockData[]>([]);
   const [filtered, setFiltered] = useState<StockData[]>([]);
   const [selectedInterval, setSelectedInterval] = useState("1M");
 
@@ -59,15 +56,17 @@ export default function StockDetailPage() {
   const [selectedPredInterval, setSelectedPredInterval] = useState(30);
   const [predLoading, setPredLoading] = useState(true);
 
-  // Fetch stock historical data
+  // Fetch stock historical data for the selected interval (range + downsampling done server-side)
   useEffect(() => {
     async function fetchStock() {
       try {
         setLoading(true);
-        const res = await fetch(`http://localhost:8000/stocks/${symbol}`);
+        const res = await fetch(
+          `http://localhost:8000/stocks/${symbol}?interval=${selectedInterval}&fields=timestamp,close&points=${CHART_POINTS}`
+        );
         if (!res.ok) throw new Error("Unable to fetch stock data");
         const payload = await res.json();
-        setData(payload.result);
+        setFiltered(payload.result);
       } catch (err: any) {
         setError(err.message);
       } finally {
@@ -75,30 +74,7 @@ export default function StockDetailPage() {
       }
     }
     fetchStock();
-  }, [symbol]);
-
-
-  useEffect(() => {
-    if (!data.length) return;
-
-    const interval = INTERVALS.find((i) => i.label === selectedInterval);
-    if (!interval) return;
-
-    if (interval.days === Infinity) {
-      setFiltered(data);
-      return;
-    }
-
-    const now = new Date(data[data.length - 1].timestamp);
-    const filteredData = data.filter((entry) => {
-      const diff =
-        (now.getTime() - new Date(entry.timestamp).getTime()) /
-        (1000 * 60 * 60 * 24);
-      return diff <= interval.days;
-    });
-
-    setFiltered(filteredData);
-  }, [selectedInterval, data]);
+  }, [symbol, selectedInterval]);
 
   
   useEffect(() => {
@@ -106,7 +82,7 @@ export default function StockDetailPage() {
       try {
         setPredLoading(true);
         const res = await fetch(
-          `http://localhost:8000/stocks/${symbol}/predict?days=${selectedPredInterval}`
+          `http://localhost:8000/stocks/${symbol}/predict?days=${selectedPredInterval}&history=0`
         );
         const payload = await res.json();
 